@@ -1,13 +1,14 @@
-from fastapi import HTTPException, Depends, status
+from fastapi import HTTPException, Depends, Request, status
 from datetime import datetime, timedelta
-from typing import Union, Any, Annotated
+from typing import Union, Any, Annotated, Optional
 from jose import jwt
 from settings import settings
-from passlib.context import CryptContext
+from service.password_service import pwd_context
 from models.user import User
 from fastapi.security import HTTPBasic, OAuth2PasswordBearer
 from schemas.token import TokenPayload
 from utils import get_user
+from service.user_cache import get_cached_user, cache_user, get_memoized_token, memoize_token
 from database import AsyncSessionLocal
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -17,7 +18,7 @@ ALGORITHM = "HS256"
 
 securityBasic = HTTPBasic()
 oauth_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+optional_oauth_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 async def get_db() -> AsyncSession:
     async with AsyncSessionLocal() as session:
@@ -54,12 +55,20 @@ def create_refresh_token(data: Union[str, Any], expires_delta: int = None) -> st
 
 
 
-async def get_current_user(token: str = Depends(oauth_scheme), db: AsyncSession = Depends(get_db)) -> User:
-    try:
+def decode_token(token: str) -> TokenPayload:
+    token_data = get_memoized_token(token)
+    if token_data is None:
         payload = jwt.decode(
             token, settings.jwt_secret_key, algorithms=[ALGORITHM]
         )
         token_data = TokenPayload(**payload)
+        memoize_token(token, token_data)
+    return token_data
+
+
+async def get_current_user(token: str = Depends(oauth_scheme), db: AsyncSession = Depends(get_db)) -> User:
+    try:
+        token_data = decode_token(token)
 
         if datetime.fromtimestamp(token_data.exp) < datetime.now():
             raise HTTPException(
@@ -73,6 +82,10 @@ async def get_current_user(token: str = Depends(oauth_scheme), db: AsyncSession
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    user = await get_cached_user(token_data.sub)
+    if user is not None:
+        return user
+
     user = await get_user(token_data.sub, db)
 
     if user is None:
@@ -80,9 +93,26 @@ async def get_current_user(token: str = Depends(oauth_scheme), db: AsyncSession
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Could not find user",
         )
+    await cache_user(user)
     return user
 
 
+async def get_current_email(request: Request,
+                            token: Optional[str] = Depends(optional_oauth_scheme),
+                            db: AsyncSession = Depends(get_db)) -> str:
+    """Email of the caller, from a bearer token or else from the Google login session."""
+    if token:
+        return (await get_current_user(token, db)).email
+    user = request.session.get('user')
+    if not user or not user.get('email'):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user['email']
+
+
 class RoleChecker:
     def __init__(self, allowed_roles):
         self.allowed_roles = allowed_roles
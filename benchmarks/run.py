@@ -0,0 +1,246 @@
+"""
+Offline load test for the API and the email worker.
+
+Starts the app under uvicorn against local stand-ins (fakeredis or a local
+Redis, an in-memory publisher instead of RabbitMQ, an aiosmtpd sink, SQLite
+and stub extractors) and reports latency percentiles and throughput per scenario:
+
+    python -m benchmarks.run --concurrency 50 --requests 2000 --output before.json
+    python -m benchmarks.run --baseline before.json --output after.json
+"""
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+SCENARIOS = ("download_link", "metadata", "token", "email_worker")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(latencies: List[float], errors: int, duration: float) -> Dict:
+    """Latency percentiles in milliseconds and throughput in requests per second."""
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration > 0 else 0.0,
+    }
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    result["latency_ms"] = {
+        "p50": round(p50 * 1000, 2),
+        "p95": round(p95 * 1000, 2),
+        "p99": round(p99 * 1000, 2),
+        "max": round(max(latencies, default=0.0) * 1000, 2),
+    }
+    return result
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Regressions of `current` against `baseline`: a p95 latency or throughput
+    more than `tolerance` percent worse in any scenario present in both runs.
+    """
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        p95, p95_before = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95_before and (p95 - p95_before) / p95_before * 100 > tolerance:
+            regressions.append(f"{name}: p95 {p95_before}ms -> {p95}ms")
+        rps, rps_before = result["throughput_rps"], before["throughput_rps"]
+        if rps_before and (rps_before - rps) / rps_before * 100 > tolerance:
+            regressions.append(f"{name}: throughput {rps_before}rps -> {rps}rps")
+    return regressions
+
+
+async def drive(concurrency: int, total: int, request: Callable[[int], Awaitable[bool]]) -> Dict:
+    """Runs `total` requests from `concurrency` closed-loop clients."""
+    latencies: List[float] = []
+    errors = 0
+    numbers = iter(range(total))
+
+    async def client():
+        nonlocal errors
+        for number in numbers:
+            started_at = time.perf_counter()
+            try:
+                ok = await request(number)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started_at)
+            if not ok:
+                errors += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started_at)
+
+
+def configure_environment(args, smtp_port: int, workdir: str) -> None:
+    """Points the app settings at the stand-ins. Must run before any app module is imported."""
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{workdir}/benchmark.db",
+        "CREATE_SCHEMA_ON_STARTUP": "true",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "GMAIL_USER": "",
+        "REDIS_URL": args.redis_url or "redis://127.0.0.1:6379",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        "LOG_BODY_SAMPLE_RATE": "0",
+        "RATE_LIMIT_ENABLED": str(args.rate_limit).lower(),
+    })
+    for name in ("SECRET_KEY", "JWT_SECRET_KEY", "JWT_REFRESH_KEY",
+                 "GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "RABBITMQ_URL"):
+        os.environ.setdefault(name, "benchmark")
+
+
+def session_cookie(secret_key: str, session: Dict) -> str:
+    """A cookie SessionMiddleware accepts, so the browser-session endpoints can be driven."""
+    from itsdangerous import TimestampSigner
+    data = base64.b64encode(json.dumps(session).encode())
+    return TimestampSigner(secret_key).sign(data).decode()
+
+
+def video_id(number: int, videos: int) -> str:
+    return f"bench{number % videos:06d}"
+
+
+async def run(args) -> Dict:
+    import httpx
+    import uvicorn
+    from benchmarks.standins import install
+
+    stand_ins = install(int(os.environ["SMTP_PORT"]), args.extract_latency_ms / 1000, args.redis_url)
+    from main import app, settings
+    import worker
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        credentials = {"username": "benchmark", "password": "benchmark"}
+        await client.post("/register", json={**credentials, "email": "benchmark@example.com", "role": "user"})
+        response = await client.post("/token", data=credentials)
+        response.raise_for_status()
+        bearer = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        cookies = {"session": session_cookie(settings.secret_key, {"user": {"email": "benchmark@example.com"}})}
+
+        async def finished(response) -> bool:
+            if response.status_code != 202:
+                return False
+            if not args.follow_jobs:
+                return True
+            while True:
+                job = (await client.get(response.json()["status_url"], headers=bearer, cookies=cookies)).json()
+                if job["status"] in ("done", "failed"):
+                    return job["status"] == "done"
+                await asyncio.sleep(0.01)
+
+        async def download_link(number: int) -> bool:
+            params = {"video_id": video_id(number, args.videos), "fmt": "mp4"}
+            return await finished(await client.get("/get-download-link/", params=params, cookies=cookies))
+
+        async def metadata(number: int) -> bool:
+            params = {"video_id": video_id(number, args.videos), "fmt": "mp4"}
+            return await finished(await client.get("/get-metadata/", params=params, headers=bearer))
+
+        async def token(number: int) -> bool:
+            response = await client.post("/token", data=credentials)
+            return response.status_code == 200
+
+        async def email_worker(number: int) -> bool:
+            await worker.send_email("benchmark@example.com", "Benchmark", f"Message {number}")
+            return True
+
+        requests = {"download_link": download_link, "metadata": metadata,
+                    "token": token, "email_worker": email_worker}
+        results = {}
+        worker.smtp_pool.start()
+        try:
+            for name in args.scenarios:
+                results[name] = await drive(args.concurrency, args.requests, requests[name])
+                print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+        finally:
+            await worker.smtp_pool.close()
+
+    server.should_exit = True
+    await serving
+    stand_ins.smtp.stop()
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {name: getattr(args, name) for name in
+                   ("concurrency", "requests", "videos", "extract_latency_ms", "bcrypt_rounds", "rate_limit", "follow_jobs")},
+        "redis": args.redis_url or "fakeredis",
+        "scenarios": results,
+        "stand_ins": stand_ins.counters,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent clients per scenario")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--videos", type=int, default=50,
+                        help="distinct video ids; fewer ids means more cache hits")
+    parser.add_argument("--extract-latency-ms", type=float, default=200, help="stub extractor latency")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--follow-jobs", action="store_true",
+                        help="poll each extraction job until it finishes instead of stopping at 202")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="keep per-user rate limiting on; the benchmark runs as a single user")
+    parser.add_argument("--redis-url", help="use a local Redis instead of fakeredis")
+    parser.add_argument("--database-url", help="use this database instead of a temporary SQLite file")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=10, help="allowed regression in percent")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, free_port(), workdir)
+        results = asyncio.run(run(args))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
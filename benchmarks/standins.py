@@ -0,0 +1,105 @@
+"""
+Local stand-ins the benchmark puts in place of Redis, RabbitMQ, Celery,
+SMTP and the video extractors. Import this module only after the
+environment has been configured, it loads the app settings.
+"""
+import time
+from typing import Any, Dict, Optional
+from aiosmtpd.controller import Controller
+from schemas.manifest import VideoManifest, StreamInfo
+
+
+class SinkHandler:
+    """aiosmtpd handler that accepts and drops every message."""
+
+    def __init__(self) -> None:
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted"
+
+
+def start_smtp_sink(port: int) -> Controller:
+    controller = Controller(SinkHandler(), hostname="127.0.0.1", port=port)
+    controller.start()
+    return controller
+
+
+class InMemoryPublisher:
+    """Takes the place of RabbitPublisher: messages are counted and dropped."""
+
+    def __init__(self) -> None:
+        self.published = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def publish(self, payload: Dict[str, Any], routing_key: str = "email_queue") -> None:
+        self.published += 1
+
+
+class CeleryShim:
+    """Takes the place of the send_email celery task."""
+
+    def __init__(self) -> None:
+        self.queued = 0
+
+    def delay(self, **kwargs) -> None:
+        self.queued += 1
+
+
+def stub_get_manifest(latency: float):
+    """BaseService.get_manifest that sleeps `latency` seconds on the extraction executor."""
+
+    def get_manifest(self) -> VideoManifest:
+        time.sleep(latency)
+        return VideoManifest(source=self.name, video_id=self.content_id, title="Benchmark", duration=60, streams=[
+            StreamInfo(mime_type="video/mp4", subtype="mp4", resolution="720p",
+                       url=f"https://example.com/{self.content_id}.mp4"),
+            StreamInfo(mime_type="video/webm", subtype="webm", resolution="1080p",
+                       url=f"https://example.com/{self.content_id}.webm"),
+        ])
+
+    return get_manifest
+
+
+class StandIns:
+    def __init__(self, publisher: InMemoryPublisher, celery: CeleryShim, smtp: Controller) -> None:
+        self.publisher = publisher
+        self.celery = celery
+        self.smtp = smtp
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        return {
+            "published": self.publisher.published,
+            "celery_queued": self.celery.queued,
+            "smtp_received": self.smtp.handler.received,
+        }
+
+
+def install(smtp_port: int, extract_latency: float, redis_url: Optional[str] = None) -> StandIns:
+    """Swaps the stand-ins into the already configured app modules."""
+    import main
+    import service.manifest_service as manifest_service
+    import service.rabbitmq_service as rabbitmq_service
+    from service.redis_service import redis_pool
+    from service.job_service import job_service
+    from service.youtube_service import YoutubeService
+    from service.instagram_service import InstagramService
+
+    if not redis_url:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        redis_pool._redis = fakeredis.FakeAsyncRedis(server=server)
+        job_service._redis = fakeredis.FakeAsyncRedis(server=server)
+
+    publisher, celery = InMemoryPublisher(), CeleryShim()
+    rabbitmq_service.rabbit_publisher = main.rabbit_publisher = publisher
+    manifest_service.send_email = main.send_email = celery
+    YoutubeService.get_manifest = InstagramService.get_manifest = stub_get_manifest(extract_latency)
+    return StandIns(publisher, celery, start_smtp_sink(smtp_port))
@@ -1,32 +1,168 @@
+import time
 import asyncio
+import threading
+from typing import List, Optional, Tuple
 from celery import Celery
-from aiosmtplib import SMTP
+from celery.signals import worker_init
+from prometheus_client import start_http_server
 from email.mime.text import MIMEText
 from email.header import Header
 from settings import settings
 import traceback
 from logger import get_logger
+from service.smtp_pool import SMTPPool, RECONNECT_ERRORS
+from metrics import smtp_send_seconds, email_delivery_delay_seconds
 import os
 
 app = Celery(__name__, broker=settings.celery_broker_url, backend=settings.celery_result_backend)
 logger = get_logger('celery_worker.log')
 
 
-async def send_email_async(to_email, subject, body):
+@worker_init.connect
+def serve_metrics(**kwargs):
+    start_http_server(settings.celery_metrics_port)
+
+
+def build_message(to_email, subject, body) -> str:
+    msg = MIMEText(body, 'plain', 'utf-8')
+    msg['From'] = Header(settings.gmail_user, 'utf-8')
+    msg['To'] = Header(to_email, 'utf-8')
+    msg['Subject'] = Header(subject, 'utf-8')
+    return msg.as_string()
+
+
+class EmailBatcher:
+    """
+    Collects emails submitted by concurrent tasks for up to `window_ms` (or
+    until `batch_size` is reached) and sends them over one SMTP session.
+    When the session drops mid-batch, the rest of the batch moves to a fresh
+    one; a message fails only if the fresh session drops on it too.
+    """
+
+    def __init__(self, smtp_pool: SMTPPool, batch_size: int, window_ms: float) -> None:
+        self.smtp_pool = smtp_pool
+        self.batch_size = batch_size
+        self.window = window_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._sender: Optional[asyncio.Task] = None
+
+    async def submit(self, to_email, message: str) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._sender = asyncio.create_task(self._send_forever())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((to_email, message, future))
+        await future
+
+    async def _next_batch(self) -> List[Tuple[str, str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.window
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _send_batch(self, batch: List[Tuple[str, str, asyncio.Future]]) -> None:
+        pending = list(batch)
+        reconnected = False
+        while pending:
+            try:
+                async with self.smtp_pool.acquire() as smtp:
+                    while pending:
+                        to_email, message, future = pending[0]
+                        started_at = time.perf_counter()
+                        try:
+                            await smtp.sendmail(settings.gmail_user, to_email, message)
+                        except RECONNECT_ERRORS:
+                            smtp_send_seconds.labels(result="error").observe(time.perf_counter() - started_at)
+                            raise
+                        except Exception as e:
+                            smtp_send_seconds.labels(result="error").observe(time.perf_counter() - started_at)
+                            future.set_exception(e)
+                        else:
+                            smtp_send_seconds.labels(result="ok").observe(time.perf_counter() - started_at)
+                            future.set_result(None)
+                            reconnected = False
+                        pending.pop(0)
+            except RECONNECT_ERRORS as e:
+                if not reconnected:
+                    reconnected = True
+                    continue
+                for _, _, future in pending:
+                    future.set_exception(e)
+                return
+
+    async def _send_forever(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._send_batch(batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class EmailSender:
+    """
+    One event loop and SMTP session pool per worker process, running in a
+    background thread. Tasks from any pool thread hand their email to it.
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self.smtp_pool: Optional[SMTPPool] = None
+        self.batcher: Optional[EmailBatcher] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # forked pool processes must not reuse the parent's loop thread
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="email-loop", daemon=True).start()
+                self.smtp_pool = SMTPPool(settings.smtp_server, settings.smtp_port,
+                                          username=settings.gmail_user, password=settings.gmail_password,
+                                          max_size=settings.smtp_pool_size,
+                                          idle_timeout=settings.smtp_idle_timeout)
+                self.batcher = EmailBatcher(self.smtp_pool, batch_size=settings.celery_email_batch_size,
+                                            window_ms=settings.celery_email_batch_window_ms)
+                # the idle reaper runs on the sender loop, so sessions close before the server drops them
+                self._loop.call_soon_threadsafe(self.smtp_pool.start)
+            return self._loop
+
+    def send(self, to_email, subject, body, enqueued_at: Optional[float] = None) -> None:
+        loop = self.loop
+        coroutine = send_email_async(to_email, subject, body, enqueued_at)
+        asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+email_sender = EmailSender()
+
+
+async def send_email_async(to_email, subject, body, enqueued_at: Optional[float] = None):
     try:
-        msg = MIMEText(body, 'plain', 'utf-8')
-        msg['From'] = Header(settings.gmail_user, 'utf-8')
-        msg['To'] = Header(to_email, 'utf-8')
-        msg['Subject'] = Header(subject, 'utf-8')
-        message = msg.as_string()
-        async with SMTP(hostname=settings.smtp_server, port=settings.smtp_port) as smtp:
-            await smtp.login(settings.gmail_user, settings.gmail_password)
-            await smtp.sendmail(settings.gmail_user, to_email, message)
-            logger.info(f"Email sent to {to_email}")
+        message = build_message(to_email, subject, body)
+        if email_sender.batcher.batch_size > 1:
+            await email_sender.batcher.submit(to_email, message)
+        else:
+            await email_sender.smtp_pool.sendmail(settings.gmail_user, to_email, message)
+        logger.info(f"Email sent to {to_email}")
     except Exception as e:
         logger.error(f"Impossible sent message to {to_email}, reason <{str(e)}>")
+        return
+    if enqueued_at is not None:
+        email_delivery_delay_seconds.labels(transport="celery").observe(time.time() - enqueued_at)
 
 
 @app.task
-def send_email(subject, recipient, body):
-    asyncio.run(send_email_async(subject, recipient, body))
\ No newline at end of file
+def send_email(recipient, subject, body, enqueued_at=None):
+    email_sender.send(recipient, subject, body, enqueued_at)
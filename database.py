@@ -8,6 +8,18 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
 
 
-engine = create_async_engine(settings.database_url, echo=True)
+def engine_options(url: str) -> dict:
+    options = {"echo": settings.database_echo}
+    if not url.startswith("sqlite"):
+        options.update(pool_size=settings.database_pool_size,
+                       max_overflow=settings.database_max_overflow,
+                       pool_pre_ping=settings.database_pool_pre_ping,
+                       pool_recycle=settings.database_pool_recycle)
+    if url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {"prepared_statement_cache_size": settings.database_statement_cache_size}
+    return options
+
+
+engine = create_async_engine(settings.database_url, **engine_options(settings.database_url))
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
\ No newline at end of file
@@ -0,0 +1,30 @@
+import asyncio
+from prometheus_client import start_http_server
+from logger import get_logger
+from settings import settings
+from service.executor import extraction_executor
+from service.job_service import job_service
+from service.rabbitmq_service import rabbit_publisher
+from service.redis_service import redis_pool
+from service.manifest_service import run_job
+
+logger = get_logger('job_worker.log')
+
+
+async def main():
+    """Runs extraction jobs on a node without the API. Set JOB_WORKERS=0 on the API nodes to use only these."""
+    start_http_server(settings.job_worker_metrics_port)
+    extraction_executor.start()
+    redis_pool.start()
+    job_service.start(run_job, settings.job_worker_concurrency)
+    logger.info(f"Job worker started with {settings.job_worker_concurrency} workers")
+    try:
+        await asyncio.Future()
+    finally:
+        await job_service.stop()
+        await rabbit_publisher.close()
+        await redis_pool.stop()
+        extraction_executor.shutdown()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,11 +1,59 @@
+import os
+import json
+import queue
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import threading
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
+
+_listeners = {}
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line. Structured fields go in `extra={"fields": {...}}`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "file": record.filename,
+            "message": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
 
 def get_logger(filename):
-    logger = logging.getLogger(__name__)
-    _log_format = f"%(asctime)s - [%(levelname)s] - %(filename)s - %(message)s"
-    logger.setLevel(logging.INFO)
-    handler = TimedRotatingFileHandler(filename, when='midnight', backupCount=10)
-    handler.setFormatter(logging.Formatter(_log_format))
-    logger.addHandler(handler)
-    return logger
\ No newline at end of file
+    """
+    Returns the logger writing to `filename`, relative to the LOG_DIR
+    environment variable when set. Records are formatted on the
+    calling thread and written by a QueueListener thread, so file I/O never
+    blocks the event loop. Handlers are attached only on the first call per file.
+    """
+    logger = logging.getLogger(filename)
+    with _lock:
+        if filename in _listeners:
+            return logger
+        path = os.path.join(os.environ.get("LOG_DIR", ""), filename)
+        file_handler = TimedRotatingFileHandler(path, when='midnight', backupCount=10)
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.setFormatter(JsonFormatter())
+        listener = QueueListener(log_queue, file_handler)
+        listener.start()
+        _listeners[filename] = listener
+        logger.setLevel(logging.INFO)
+        logger.addHandler(queue_handler)
+    return logger
+
+
+@atexit.register
+def _stop_listeners():
+    with _lock:
+        for listener in _listeners.values():
+            listener.stop()
+        _listeners.clear()
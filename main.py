@@ -1,32 +1,50 @@
+import time
+_import_started = time.perf_counter()
+
 import json
+import math
+import random
+import asyncio
 from fastapi import FastAPI, HTTPException, Depends, status, Response
 from settings import AppSettings
-from fastapi.responses import JSONResponse
-from service.redis_service import get_redis_service
-from service.youtube_service import YoutubeService, VideoFormat
-from service.instagram_service import InstagramService
+from fastapi.responses import JSONResponse, StreamingResponse
+from service.redis_service import get_redis_service, redis_pool
+from service.youtube_service import VideoFormat
+from service.instagram_service import refresh_instagram_sessions
 from typing import Optional, Annotated
 from fastapi.security import OAuth2PasswordRequestForm
 from models.user import User, UserRole
 from auth import (
     create_access_token,
-    verify_password,create_refresh_token,
-    get_current_user)
+    create_refresh_token,
+    get_current_user,
+    get_current_email)
 from schemas.token import Token
 from schemas.user import UserCreate, UserResponse
-from utils import init_roles, get_user, get_role, create_user
+from schemas.manifest import VideoManifest
+from schemas.batch import BatchItem, BatchItemResult, BatchRequest, BatchResponse
+from schemas.job import Job, JobAccepted, JobResponse
+from utils import init_roles, get_user, get_role, create_user, VideoUnavailable
 from database import AsyncSessionLocal, engine, Base
 from sqlalchemy.ext.asyncio import AsyncSession
-from authlib.integrations.starlette_client import OAuth
 from fastapi.responses import RedirectResponse
 from starlette.config import Config
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi import Request
-from celery_worker import send_email
 from prometheus_fastapi_instrumentator import Instrumentator
 from logger import get_logger
-from enum import Enum
-from service.rabbitmq_service import publish_message
+from service.rabbitmq_service import rabbit_publisher
+from service.executor import extraction_executor
+from service.password_service import password_hasher
+from service.job_service import job_service
+from service.proxy_service import stream_proxy, ProxyResponse, PASSTHROUGH_STATUSES
+from service.media_cache import media_cache, served_bytes, CachedFileResponse
+from service.youtube_api import youtube_metadata
+from service.manifest_service import (
+    Source, send_email, extractions, manifest_key, remember_unavailable, check_unavailable,
+    extract_manifest, revalidate_if_stale, finish_job, deliver_job, run_job)
+from metrics import manifest_cache_lookups, extraction_rejected, proxy_rejected
+from metrics import media_cache_requests, media_cache_bytes_saved
 
 
 app = FastAPI()
@@ -36,15 +54,27 @@ app.add_middleware(SessionMiddleware, secret_key=settings.secret_key)
 logger = get_logger('api_logger.log')
 Instrumentator().instrument(app).expose(app)
 
+_oauth = None
+
 
-config_data = {'GOOGLE_CLIENT_ID': settings.google_client_id, 'GOOGLE_CLIENT_SECRET': settings.google_client_secret}
-starlette_config = Config(environ=config_data)
-oauth = OAuth(starlette_config)
-oauth.register(
-    name='google',
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
-)
+def get_oauth():
+    """
+    Google OAuth client, built on first login. authlib fetches the
+    server metadata on the first authorize call, not at import time.
+    """
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.starlette_client import OAuth
+        config_data = {'GOOGLE_CLIENT_ID': settings.google_client_id,
+                       'GOOGLE_CLIENT_SECRET': settings.google_client_secret}
+        oauth = OAuth(Config(environ=config_data))
+        oauth.register(
+            name='google',
+            server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+            client_kwargs={'scope': 'openid email profile'},
+        )
+        _oauth = oauth
+    return _oauth
 
 
 async def get_db() -> AsyncSession:
@@ -52,33 +82,101 @@ async def get_db() -> AsyncSession:
         yield session
 
 
-@app.on_event("startup")
-async def startup():
+import_seconds = time.perf_counter() - _import_started
+
+
+async def _create_schema():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    await init_roles()
+
+
+async def _start_rabbit_publisher():
+    try:
+        await rabbit_publisher.start()
+    except Exception as e:
+        logger.error(f"RabbitMQ publisher not started, will retry on first publish, reason <{str(e)}>")
+
+
+@app.on_event("startup")
+async def startup():
+    """
+    The schema is owned by alembic migrations; `create_schema_on_startup`
+    is kept for local runs and tests. Each step is timed and the report is
+    logged and kept in `app.state.startup_report`.
+    """
+    steps = []
+    if settings.create_schema_on_startup:
+        steps.append(("create_schema", _create_schema))
+    steps += [
+        ("init_roles", init_roles),
+        ("extraction_executor", extraction_executor.start),
+        ("password_hasher", password_hasher.start),
+        ("redis_listener", redis_pool.start),
+        ("rabbit_publisher", _start_rabbit_publisher),
+        ("job_workers", lambda: job_service.start(run_job, settings.job_workers)),
+    ]
+    if settings.media_cache_enabled:
+        steps.append(("media_cache", media_cache.start))
+    report = {"import_ms": round(import_seconds * 1000, 2)}
+    started_at = time.perf_counter()
+    for name, step in steps:
+        step_started_at = time.perf_counter()
+        result = step()
+        if asyncio.iscoroutine(result):
+            await result
+        report[f"{name}_ms"] = round((time.perf_counter() - step_started_at) * 1000, 2)
+    app.state.instagram_refresher = asyncio.create_task(refresh_instagram_sessions())
+    report["startup_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+    app.state.startup_report = report
+    logger.info("startup", extra={"fields": report})
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    app.state.instagram_refresher.cancel()
+    await job_service.stop()
+    if settings.media_cache_enabled:
+        await media_cache.close()
+    await stream_proxy.close()
+    await youtube_metadata.close()
+    await rabbit_publisher.close()
+    await redis_pool.stop()
+    extraction_executor.shutdown()
+    password_hasher.shutdown()
     await engine.dispose()
 
 
+def _body_sample(body: bytes) -> str:
+    return body[:settings.log_body_max_bytes].decode("utf-8", errors="replace")
+
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info(f"request: {request.method} {request.url}")
+    started_at = time.perf_counter()
+    sampled = random.random() < settings.log_body_sample_rate
+    fields = {"method": request.method, "url": str(request.url)}
+    if sampled:
+        fields["request_body"] = _body_sample(await request.body())
+
     response: Response = await call_next(request)
-    if isinstance(response, JSONResponse):
-        response_data = await response.json()
-        logger.info(f"response: {response.status_code} for {request.method} {response_data}")
-    else:
-        logger.info(f"response: {response.status_code} for {request.method}")
+
+    if sampled and response.headers.get("content-type", "").startswith("application/json"):
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        fields["response_body"] = _body_sample(body)
+        response = Response(content=body, status_code=response.status_code,
+                            headers=dict(response.headers), media_type=response.media_type)
+    fields["status"] = response.status_code
+    fields["duration_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+    logger.info("request", extra={"fields": fields})
     return response
 
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Error for {request.method} {request.url}: {exc}")
+    logger.error(f"Error for {request.method} {request.url}: {exc}", exc_info=exc)
+    return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        content={"detail": "Internal Server Error"})
+
 
 @app.get('/')
 def public(request: Request):
@@ -89,22 +187,112 @@ def public(request: Request):
     return {"detail": "Not authenticated"}
 
 
-class Source(Enum):
-    youtube = "youtube", YoutubeService
-    instagram = "instagram", InstagramService
-
-    def __init__(self, value, source_class):
-        self._value_ = value
-        self.source_class = source_class
+async def admit_extraction(source: Source, video_id: str, client: str, redis) -> None:
+    """
+    Guards a cache miss before it reaches the extractor. Sheds load with 503
+    while the executor queue is too long, then takes a token from the
+    client's and the source's buckets or answers 429. Misses that join an
+    extraction already running on this replica cost nothing and pass.
+    `client` is the user's email, which both the session and the token
+    logins carry, so one person gets one bucket on every endpoint.
+    """
+    if extractions.in_flight((source, video_id)):
+        return
+    if extraction_executor.queue_depth() >= settings.extraction_shed_queue_depth:
+        extraction_rejected.labels(source=source.value, reason="shed").inc()
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Service is overloaded, try again later",
+                            headers={"Retry-After": str(settings.extraction_shed_retry_after)})
+    if not settings.rate_limit_enabled:
+        return
+    retry_after = await redis.take_tokens([
+        (f"ratelimit:{source.value}:{client}",
+         settings.rate_limit_user_capacity, settings.rate_limit_user_refill_per_second),
+        (f"ratelimit:{source.value}",
+         settings.rate_limit_source_capacity, settings.rate_limit_source_refill_per_second),
+    ])
+    if retry_after > 0:
+        extraction_rejected.labels(source=source.value, reason="rate_limited").inc()
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Too many requests, try again later",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+async def resolve_manifest(source: Source, video_id: str, redis, endpoint: str, client: str) -> VideoManifest:
+    """Cached manifest, or an extraction in the request path for misses that pass admit_extraction."""
+    cache, ttl = await redis.get_cache_with_ttl(key=manifest_key(source, video_id))
+    manifest_cache_lookups.labels(endpoint=endpoint, result="hit" if cache else "miss").inc()
+    if cache:
+        manifest = VideoManifest.model_validate_json(cache)
+        revalidate_if_stale(ttl, manifest, source, video_id, redis)
+        return manifest
+    await check_unavailable(source, video_id, redis)
+    await admit_extraction(source, video_id, client, redis)
+    return await extract_manifest(source, video_id, redis)
+
+
+async def api_metadata(video_id: str, redis) -> dict:
+    """Title and duration from the YouTube Data API, cached apart from the manifests."""
+    key = f"metadata:youtube:{video_id}"
+    cache = await redis.get_cache(key=key)
+    if cache:
+        return json.loads(cache)
+    info = await youtube_metadata.get(video_id)
+    if info is None:
+        error = VideoUnavailable(status_code=status.HTTP_404_NOT_FOUND, detail="Video not found")
+        await remember_unavailable(Source.youtube, video_id, error, redis)
+        raise error
+    await redis.set_cache(key=key, value=json.dumps(info), expire=settings.youtube_api_cache_ttl)
+    return info
 
 
-@app.get("/get-download-link/")
+async def submit_job(request: Request, job: Job, client: str, redis) -> JSONResponse:
+    """
+    Answers 202 with the job id. A cached manifest finishes the job before
+    answering. A miss for a video known to be unavailable fails right away.
+    Otherwise metadata of YouTube videos comes from the Data API when a key
+    is configured; anything else, or a failed Data API call, passes
+    admit_extraction and is queued for the job workers.
+    """
+    source = Source[job.source]
+    cache, ttl = await redis.get_cache_with_ttl(key=manifest_key(source, job.video_id))
+    manifest_cache_lookups.labels(endpoint=job.kind, result="hit" if cache else "miss").inc()
+    if cache:
+        manifest = VideoManifest.model_validate_json(cache)
+        revalidate_if_stale(ttl, manifest, source, job.video_id, redis)
+        job = await finish_job(job, manifest)
+    else:
+        await check_unavailable(source, job.video_id, redis)
+        info = None
+        if job.kind == "metadata" and source is Source.youtube and youtube_metadata.enabled:
+            try:
+                info = await api_metadata(job.video_id, redis)
+            except VideoUnavailable:
+                raise
+            except Exception as e:
+                logger.error(f"Data API lookup failed for {job.video_id}, extracting instead, reason <{str(e)}>")
+        if info is not None:
+            job = await deliver_job(job, info)
+        else:
+            await admit_extraction(source, job.video_id, client, redis)
+            await job_service.submit(job)
+    accepted = JobAccepted(
+        detail="Job accepted, the result will also be sent by email.",
+        job_id=job.id,
+        status_url=str(request.url_for("get_job", job_id=job.id)),
+        events_url=str(request.url_for("get_job_events", job_id=job.id)),
+    )
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=accepted.model_dump())
+
+
+@app.get("/get-download-link/", status_code=status.HTTP_202_ACCEPTED, response_model=JobAccepted)
 async def get_download_link(request: Request, video_id: str, fmt: str,
                        source: Source = Source.youtube.value,
                        redis=Depends(get_redis_service)):
     """
-    Sends stream url by source, video ID and video format to user email.
-    This endpoint fetches the streaming url for a specified Source video
+    Starts a job that resolves the stream url by source, video ID and video
+    format and sends it to the user's email. Follow the job at `status_url`
+    or `events_url` to get the url without waiting for the email.
 
     - Args:
         video_id (str): A valid video ID.
@@ -122,26 +310,23 @@ async def get_download_link(request: Request, video_id: str, fmt: str,
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    cache = await redis.get_cache(key=f"{source}${video_id}${fmt}")
-    if cache:
-        await publish_message(cache.decode(), user["email"])
-        return {"detail": "Link for download video was sent by email."}
-
     service = source.source_class(video_id, fmt)
-    res = await service.fetch_video_info()
-    await redis.set_cache(key=f"{source}${video_id}${fmt}", value=res["url"], expire=120)
-    await publish_message(res["url"],  user["email"])
-    return {"detail": "Link for download video was sent by email."}
+    service.check_id()
+    service.check_format()
+    job = Job(kind="download_link", source=source.value, video_id=video_id, fmt=fmt, email=user["email"])
+    return await submit_job(request, job, client=user["email"], redis=redis)
 
 
-@app.get("/get-metadata/")
-async def get_metadata(user: Annotated[User, Depends(get_current_user)],
+@app.get("/get-metadata/", status_code=status.HTTP_202_ACCEPTED, response_model=JobAccepted)
+async def get_metadata(request: Request,
+                       user: Annotated[User, Depends(get_current_user)],
                        video_id: str, fmt: str,
                        source: Source = Source.youtube.value,
                        redis=Depends(get_redis_service),
                        ):
     """
-    Sends stream metadata by source, video ID and video format to user email.
+    Starts a job that sends stream metadata by source, video ID and video
+    format to the user's email. The metadata is also the job result.
 
     - Args:
         video_id (str): A valid video ID.
@@ -150,29 +335,199 @@ async def get_metadata(user: Annotated[User, Depends(get_current_user)],
     - Example:
         GET /get-metadata/?source=youtube&video_id=G2-2l9ZLftQ&fmt=mp4
     """
-    cache = await redis.get_cache(key=f"{source}${video_id}${fmt}")
-    if cache:
-        result = json.dumps(cache.decode())
-        send_email.delay(user.email, "Video metadata", result)
-        return {"detail": "Video metadata was sent by email."}
+    service = source.source_class(video_id, fmt)
+    service.check_id()
+    service.check_format()
+    job = Job(kind="metadata", source=source.value, video_id=video_id, fmt=fmt, email=user.email)
+    return await submit_job(request, job, client=user.email, redis=redis)
+
+
+async def get_own_job(job_id: str, email: str) -> Job:
+    """The job, if it belongs to `email`. Other users' jobs are reported as missing."""
+    job = await job_service.get(job_id)
+    if job is None or job.email != email:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, email: Annotated[str, Depends(get_current_email)]):
+    """
+    Current state of a job: queued, running, done (with `result`) or failed
+    (with `status_code` and `detail`). Jobs expire after `job_ttl` seconds.
+    Only the user who started the job can read it.
+    """
+    return await get_own_job(job_id, email)
 
+
+def _job_event(job: Optional[Job]) -> str:
+    if job is None:
+        return ": keep-alive\n\n"
+    return f"event: {job.status}\ndata: {JobResponse.model_validate(job.model_dump()).model_dump_json()}\n\n"
+
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str, email: Annotated[str, Depends(get_current_email)]):
+    """
+    Server-Sent Events stream of a job. Sends the current state, then every
+    change until the job is done or failed. Only the user who started the
+    job can follow it.
+    """
+    await get_own_job(job_id, email)
+    events = job_service.events(job_id, keepalive=settings.job_events_keepalive,
+                                timeout=settings.job_events_timeout)
+    return StreamingResponse((_job_event(job) async for job in events), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/download/")
+async def download(request: Request,
+                   user: Annotated[User, Depends(get_current_user)],
+                   video_id: str, fmt: str,
+                   source: Source = Source.youtube.value,
+                   redis=Depends(get_redis_service)):
+    """
+    Streams the video bytes through the API, for clients that can't use the
+    IP-bound upstream url. Range and If-Range are passed upstream, so players
+    can seek and resume. Videos in the local media cache are served from disk,
+    and misses fill the cache in the background.
+
+    - Args:
+        video_id (str): A valid video ID.
+        source (str): youtube or instagram
+        fmt (str): Desired format for the video (e.g., 'mp4', 'mov').
+    - Example:
+        GET /download/?source=youtube&video_id=G2-2l9ZLftQ&fmt=mp4
+    """
     service = source.source_class(video_id, fmt)
-    res = await service.fetch_video_info()
-    await redis.set_cache(key=f"{source}${video_id}${fmt}", value=json.dumps(res), expire=120)
-    send_email.delay(user.email, "Video metadata", res)
-    return {"detail": "Video metadata was sent by email."}
+    service.check_id()
+    service.check_format()
+    cache_key = (source.value, video_id, fmt)
+    if settings.media_cache_enabled:
+        cached = media_cache.lookup(cache_key)
+        media_cache_requests.labels(result="hit" if cached else "miss").inc()
+        if cached is not None:
+            path, entry = cached
+            media_cache_bytes_saved.inc(served_bytes(request.headers.get("Range"), entry["size"]))
+            return CachedFileResponse(media_cache, path, entry)
+    if not stream_proxy.try_acquire():
+        proxy_rejected.inc()
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many downloads in progress, try again later",
+                            headers={"Retry-After": str(settings.extraction_shed_retry_after)})
+    try:
+        manifest = await resolve_manifest(source, video_id, redis, endpoint="download", client=user.email)
+        stream = service.select_stream(manifest)
+        upstream = await stream_proxy.open(stream.url, request.headers)
+        if upstream.status in (403, 410):
+            # the cached url expired early: extract a fresh one once
+            upstream.release()
+            await redis.delete_cache(manifest_key(source, video_id))
+            manifest = await extract_manifest(source, video_id, redis)
+            stream = service.select_stream(manifest)
+            upstream = await stream_proxy.open(stream.url, request.headers)
+        if upstream.status not in PASSTHROUGH_STATUSES:
+            upstream.release()
+            logger.error(f"Upstream answered {upstream.status} for {source.value}/{video_id}")
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Upstream download failed")
+    except BaseException:
+        stream_proxy.release()
+        raise
+    response = ProxyResponse(stream_proxy, upstream, source.value)
+    if settings.media_cache_enabled:
+        media_cache.schedule_fill(cache_key, stream.url, stream.mime_type, stream_proxy.session(), stream.filesize)
+    return response
+
+
+def _batch_item_result(item: BatchItem, manifest) -> BatchItemResult:
+    result = BatchItemResult(source=item.source, video_id=item.video_id, fmt=item.fmt)
+    try:
+        service = Source[item.source].source_class(item.video_id, item.fmt)
+        service.check_id()
+        service.check_format()
+        if isinstance(manifest, Exception):
+            raise manifest
+        info = manifest.video_info(service.select_stream(manifest))
+    except HTTPException as e:
+        result.status_code, result.detail = e.status_code, e.detail
+        return result
+    except Exception as e:
+        logger.error(f"Batch item {item.source}/{item.video_id} failed, reason <{str(e)}>")
+        result.status_code, result.detail = status.HTTP_500_INTERNAL_SERVER_ERROR, "Extraction failed"
+        return result
+    return result.model_copy(update=info)
+
+
+@app.post("/batch/", response_model=BatchResponse)
+async def get_batch(user: Annotated[User, Depends(get_current_user)],
+                    batch: BatchRequest,
+                    redis=Depends(get_redis_service)):
+    """
+    Resolves download links and metadata for many videos in one request.
+    Cached manifests are read with one MGET, misses are extracted concurrently.
+    Each item reports its own status, so one failing video does not fail the batch.
+
+    - Args:
+        items (list): up to `batch_max_items` of {source, video_id, fmt}.
+        delivery (str): "email" sends all results in one email, "response" returns them.
+    - Example:
+        POST /batch/ {"items": [{"source": "youtube", "video_id": "G2-2l9ZLftQ", "fmt": "mp4"}]}
+    """
+    videos = []
+    for item in batch.items:
+        service = Source[item.source].source_class(item.video_id, item.fmt)
+        if not service.is_valid_id():
+            continue
+        try:
+            service.check_format()
+        except HTTPException:
+            continue
+        videos.append((Source[item.source], item.video_id))
+    videos = list(dict.fromkeys(videos))
+
+    cached = await redis.get_many([manifest_key(source, video_id) for source, video_id in videos])
+    hits = sum(1 for cache in cached if cache)
+    manifest_cache_lookups.labels(endpoint="batch", result="hit").inc(hits)
+    manifest_cache_lookups.labels(endpoint="batch", result="miss").inc(len(cached) - hits)
+    limit = asyncio.Semaphore(settings.batch_max_concurrency)
+
+    async def resolve(source: Source, video_id: str, cache: Optional[bytes]) -> VideoManifest:
+        if cache:
+            return VideoManifest.model_validate_json(cache)
+        await check_unavailable(source, video_id, redis)
+        await admit_extraction(source, video_id, user.email, redis)
+        async with limit:
+            return await extract_manifest(source, video_id, redis)
+
+    resolved = await asyncio.gather(*(resolve(source, video_id, cache)
+                                      for (source, video_id), cache in zip(videos, cached)),
+                                    return_exceptions=True)
+    manifests = {(source.value, video_id): manifest for (source, video_id), manifest in zip(videos, resolved)}
+    results = [_batch_item_result(item, manifests.get((item.source, item.video_id))) for item in batch.items]
+
+    if batch.delivery == "response":
+        return BatchResponse(detail="Batch resolved.", results=results)
+    body = json.dumps([result.model_dump(exclude_none=True) for result in results], ensure_ascii=False)
+    send_email.delay(recipient=user.email, subject="Video links", body=body, enqueued_at=time.time())
+    return BatchResponse(detail="Batch results were sent by email.")
 
 
 @app.post("/token")
 async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(get_db)) -> Token:
     user = await get_user(form_data.username, db)
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify(form_data.password, user.password_hash)
 
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
     return Token(access_token=create_access_token(data={"name": user.username, "role": user.role.name}),
                  refresh_token=create_refresh_token(data={"name": user.username, "role": user.role.name})
                  )
@@ -193,13 +548,13 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
 @app.get('/login/google')
 async def login(request: Request):
     redirect_uri = request.url_for('auth')
-    return await oauth.google.authorize_redirect(request, redirect_uri)
+    return await get_oauth().google.authorize_redirect(request, redirect_uri)
 
 
 @app.get('/auth')
 async def auth(request: Request):
     try:
-        access_token = await oauth.google.authorize_access_token(request)
+        access_token = await get_oauth().google.authorize_access_token(request)
     except Exception:
         return RedirectResponse(url='/')
     userinfo = access_token['userinfo']
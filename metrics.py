@@ -0,0 +1,186 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+coalesced_requests = Counter(
+    "extraction_coalesced_requests_total",
+    "Requests that reused an extraction already running for the same key",
+    ["source", "scope"],
+)
+
+extraction_queue_depth = Gauge(
+    "extraction_queue_depth",
+    "Extractions waiting for a free slot in the shared executor",
+    ["source"],
+)
+
+extraction_wait_seconds = Histogram(
+    "extraction_wait_seconds",
+    "Time an extraction spent waiting for a free slot",
+    ["source"],
+)
+
+extraction_run_seconds = Histogram(
+    "extraction_run_seconds",
+    "Time an extraction spent running in the shared executor",
+    ["source"],
+)
+
+email_retries = Counter(
+    "email_retries_total",
+    "Emails scheduled for a delayed retry, by attempt number",
+    ["attempt"],
+)
+
+email_parked = Counter(
+    "email_parked_total",
+    "Emails moved to the parking queue after exhausting their retries",
+)
+
+email_retry_queue_depth = Gauge(
+    "email_retry_queue_depth",
+    "Messages waiting in each retry delay queue and the parking queue",
+    ["queue"],
+)
+
+cache_requests = Counter(
+    "cache_requests_total",
+    "Cache lookups by layer (l1 or redis) and result (hit or miss)",
+    ["layer", "result"],
+)
+
+password_queue_depth = Gauge(
+    "password_queue_depth",
+    "Password hash/verify operations waiting for a free worker process",
+)
+
+password_seconds = Histogram(
+    "password_seconds",
+    "Time spent hashing or verifying a password in the worker pool",
+    ["operation"],
+)
+
+password_rejected = Counter(
+    "password_rejected_total",
+    "Password operations rejected because the wait queue was full",
+    ["operation"],
+)
+
+manifest_cache_lookups = Counter(
+    "manifest_cache_lookups_total",
+    "Manifest cache lookups by endpoint and result (hit or miss)",
+    ["endpoint", "result"],
+)
+
+manifest_fetch_seconds = Histogram(
+    "manifest_fetch_seconds",
+    "Time to extract a manifest from the source, including the executor wait",
+    ["source", "result"],
+)
+
+publish_seconds = Histogram(
+    "rabbitmq_publish_seconds",
+    "Time to publish a message to RabbitMQ until it is confirmed",
+    ["routing_key"],
+)
+
+smtp_send_seconds = Histogram(
+    "smtp_send_seconds",
+    "Time to hand one email to the SMTP server",
+    ["result"],
+)
+
+email_delivery_delay_seconds = Histogram(
+    "email_delivery_delay_seconds",
+    "Time from enqueueing an email in the API to handing it to the SMTP server",
+    ["transport"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+extraction_rejected = Counter(
+    "extraction_rejected_total",
+    "Cache misses refused before extraction, by reason (rate_limited or shed)",
+    ["source", "reason"],
+)
+
+invalid_video_ids = Counter(
+    "invalid_video_ids_total",
+    "Requests rejected because the video id does not match the source's pattern",
+    ["source"],
+)
+
+negative_cache_hits = Counter(
+    "negative_cache_hits_total",
+    "Misses answered from a cached not found, unavailable or private result",
+    ["source"],
+)
+
+job_seconds = Histogram(
+    "job_seconds",
+    "Time from submitting an extraction job to its completion",
+    ["kind", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+proxy_bytes = Counter(
+    "proxy_bytes_total",
+    "Media bytes streamed to clients through the download proxy",
+    ["source"],
+)
+
+proxy_active_downloads = Gauge(
+    "proxy_active_downloads",
+    "Downloads currently streamed through the proxy",
+)
+
+proxy_rejected = Counter(
+    "proxy_rejected_total",
+    "Proxied downloads refused because every download slot was in use",
+)
+
+media_cache_requests = Counter(
+    "media_cache_requests_total",
+    "Proxied downloads by media cache result (hit or miss)",
+    ["result"],
+)
+
+media_cache_bytes_saved = Counter(
+    "media_cache_bytes_saved_total",
+    "Bytes served from the media cache instead of upstream",
+)
+
+media_cache_evictions = Counter(
+    "media_cache_evictions_total",
+    "Files evicted from the media cache to stay within its byte budget",
+)
+
+media_cache_fills = Counter(
+    "media_cache_fills_total",
+    "Background media cache downloads by result",
+    ["result"],
+)
+
+media_cache_size_bytes = Gauge(
+    "media_cache_size_bytes",
+    "Bytes currently stored in the media cache",
+)
+
+download_bytes = Counter(
+    "downloader_bytes_total",
+    "Bytes written by the ranged downloader",
+)
+
+download_retries = Counter(
+    "downloader_range_retries_total",
+    "Byte ranges the ranged downloader had to request again",
+)
+
+youtube_api_batch_size = Histogram(
+    "youtube_api_batch_size",
+    "Video ids sent in one YouTube Data API videos.list call",
+    buckets=(1, 2, 5, 10, 20, 30, 40, 50),
+)
+
+youtube_api_seconds = Histogram(
+    "youtube_api_seconds",
+    "Latency of YouTube Data API videos.list calls",
+)
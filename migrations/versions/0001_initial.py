@@ -0,0 +1,48 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 12:00:00
+
+Databases created by the old `Base.metadata.create_all` on startup already
+have these tables, so only the missing ones are created.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if "user_roles" not in existing:
+        op.create_table(
+            "user_roles",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(16)),
+            sa.Column("is_admin", sa.Boolean()),
+        )
+    if "users" in existing:
+        return
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(16)),
+        sa.Column("password_hash", sa.String(128)),
+        sa.Column("email", sa.String(128)),
+        sa.Column("role_id", sa.Integer(), sa.ForeignKey("user_roles.id")),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("users")
+    op.drop_table("user_roles")
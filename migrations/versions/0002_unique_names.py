@@ -0,0 +1,40 @@
+"""unique indexes on users.username and user_roles.name
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:10:00
+
+Fails if duplicate usernames or role names already exist; remove them first.
+Indexes already made by `Base.metadata.create_all` are kept as they are.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    indexes = [
+        ("ix_users_username", "users", ["username"], True),
+        ("ix_user_roles_name", "user_roles", ["name"], True),
+        ("ix_users_role_id", "users", ["role_id"], False),
+    ]
+    for name, table, columns, unique in indexes:
+        if name not in {index["name"] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_users_role_id", table_name="users")
+    op.drop_index("ix_user_roles_name", table_name="user_roles")
+    op.drop_index("ix_users_username", table_name="users")
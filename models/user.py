@@ -9,17 +9,17 @@ from enum import Enum
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
-    username = Column(String(16))
+    username = Column(String(16), unique=True, index=True)
     password_hash = Column(String(128))
     email = Column(String(128))
-    role_id = Column(Integer, ForeignKey("user_roles.id"))
+    role_id = Column(Integer, ForeignKey("user_roles.id"), index=True)
     role = relationship('UserRole', back_populates="users", lazy="selectin")
 
 class UserRole(Base):
     __tablename__ = "user_roles"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String(16))
+    name = Column(String(16), unique=True, index=True)
     is_admin = Column(Boolean, default=False)
     users = relationship('User', back_populates='role')
 
@@ -0,0 +1,32 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+from settings import settings
+
+
+class BatchItem(BaseModel):
+    source: Literal["youtube", "instagram"] = "youtube"
+    video_id: str
+    fmt: str
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(min_length=1, max_length=settings.batch_max_items)
+    delivery: Literal["email", "response"] = "email"
+
+
+class BatchItemResult(BaseModel):
+    source: str
+    video_id: str
+    fmt: str
+    status_code: int = 200
+    detail: Optional[str] = None
+    title: Optional[str] = None
+    duration: Optional[int] = None
+    filesize_mb: Optional[float] = None
+    resolution: Optional[str] = None
+    url: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    detail: str
+    results: Optional[List[BatchItemResult]] = None
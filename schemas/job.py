@@ -0,0 +1,46 @@
+import time
+import uuid
+from typing import Any, Dict, Literal, Optional
+from pydantic import BaseModel, Field
+
+JOB_FINISHED = ("done", "failed")
+
+
+class Job(BaseModel):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    kind: Literal["download_link", "metadata"]
+    source: str
+    video_id: str
+    fmt: str
+    email: str
+    status: Literal["queued", "running", "done", "failed"] = "queued"
+    status_code: Optional[int] = None
+    detail: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: float = Field(default_factory=time.time)
+    updated_at: float = Field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in JOB_FINISHED
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    source: str
+    video_id: str
+    fmt: str
+    status: str
+    status_code: Optional[int] = None
+    detail: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: float
+    updated_at: float
+
+
+class JobAccepted(BaseModel):
+    detail: str
+    job_id: str
+    status_url: str
+    events_url: str
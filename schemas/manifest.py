@@ -0,0 +1,52 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+MANIFEST_VERSION = 1
+
+
+class StreamInfo(BaseModel):
+    itag: Optional[int] = None
+    mime_type: str
+    subtype: str
+    resolution: Optional[str] = None
+    abr: Optional[str] = None
+    filesize: Optional[int] = None
+    filesize_mb: Optional[float] = None
+    is_progressive: bool = True
+    url: str
+
+    @property
+    def height(self) -> int:
+        if self.resolution and self.resolution.endswith("p"):
+            return int(self.resolution[:-1])
+        return 0
+
+
+class VideoManifest(BaseModel):
+    """
+    Every stream of one video, as returned by a single extraction.
+    Bump MANIFEST_VERSION on any incompatible change; it is part of the cache key.
+    """
+    version: int = MANIFEST_VERSION
+    source: str
+    video_id: str
+    title: Optional[str] = None
+    duration: Optional[int] = None
+    streams: List[StreamInfo]
+
+    def select(self, fmt: str) -> Optional[StreamInfo]:
+        """Highest resolution video stream of the given format."""
+        candidates = [stream for stream in self.streams
+                      if stream.subtype == fmt and stream.mime_type.startswith("video/")]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda stream: (stream.height, stream.is_progressive))
+
+    def video_info(self, stream: StreamInfo) -> dict:
+        return {
+            "duration": self.duration,
+            "filesize_mb": stream.filesize_mb,
+            "title": self.title,
+            "url": stream.url,
+            "resolution": stream.resolution,
+        }
@@ -0,0 +1,273 @@
+"""
+Parallel ranged downloader for archiving whole files.
+
+    python -m service.downloader youtube G2-2l9ZLftQ mp4 -o video.mp4
+    python -m service.downloader --input archive.txt --output-dir archive/
+
+Each line of the input file is "<source> <video_id> <fmt>".
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Callable, List, Optional, Tuple
+from logger import get_logger
+from settings import settings
+from metrics import download_bytes, download_retries
+
+logger = get_logger('downloader.log')
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Bandwidth:
+    """Token bucket of bytes per second shared by every download. A rate of 0 means unlimited."""
+
+    def __init__(self, rate: int) -> None:
+        self.rate = rate
+        self._allowance = float(rate)
+        self._updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def consume(self, size: int) -> None:
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate, self._allowance + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._allowance -= size
+            if self._allowance < 0:
+                await asyncio.sleep(-self._allowance / self.rate)
+
+
+class RangedDownloader:
+    """
+    Splits a file into `part_size` byte ranges and fetches up to
+    `connections_per_job` of them at once, writing each chunk at its offset
+    into a preallocated `.part` file. All jobs share `max_connections`
+    connections and the `bandwidth` budget. A failed range is retried from
+    the last byte written, and the file is renamed into place only once its
+    size has been verified.
+    """
+
+    def __init__(self, max_connections: int, connections_per_job: int, part_size: int,
+                 bandwidth: int = 0, retries: int = 3, retry_backoff: float = 0.5,
+                 chunk_size: int = 64 * 1024) -> None:
+        self.max_connections = max_connections
+        self.connections_per_job = connections_per_job
+        self.part_size = part_size
+        self.bandwidth = Bandwidth(bandwidth)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.chunk_size = chunk_size
+        self._connections: Optional[asyncio.Semaphore] = None
+        self._session = None
+
+    def session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(sock_connect=settings.proxy_connect_timeout,
+                                              sock_read=settings.proxy_read_timeout),
+                auto_decompress=False,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _slot(self) -> asyncio.Semaphore:
+        if self._connections is None:
+            self._connections = asyncio.Semaphore(self.max_connections)
+        return self._connections
+
+    async def probe_size(self, url: str) -> Optional[int]:
+        """Exact size from a one-byte range request, or None when the server ignores ranges."""
+        async with self._slot(), self.session().get(url, headers={"Range": "bytes=0-0"}) as response:
+            if response.status != 206:
+                return None
+            return int(response.headers["Content-Range"].rsplit("/", 1)[1])
+
+    def ranges(self, size: int) -> List[Tuple[int, int]]:
+        return [(start, min(start + self.part_size, size) - 1) for start in range(0, size, self.part_size)]
+
+    async def _fetch_range(self, url: str, fd: int, start: int, end: int, on_bytes: Callable[[int], None]) -> None:
+        offset = start
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._slot(), \
+                        self.session().get(url, headers={"Range": f"bytes={offset}-{end}"}) as response:
+                    if response.status != 206:
+                        raise DownloadError(f"expected 206 for bytes {offset}-{end}, got {response.status}")
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        chunk = chunk[:end + 1 - offset]
+                        await self.bandwidth.consume(len(chunk))
+                        await asyncio.to_thread(os.pwrite, fd, chunk, offset)
+                        offset += len(chunk)
+                        on_bytes(len(chunk))
+                if offset == end + 1:
+                    return
+                raise DownloadError(f"range {start}-{end} ended at {offset}")
+            except Exception as e:
+                if attempt == self.retries:
+                    raise DownloadError(f"range {start}-{end} failed after {self.retries} retries: {e}") from e
+                download_retries.inc()
+                logger.error(f"Retrying range {offset}-{end}, reason <{str(e)}>")
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+    async def download(self, url: str, path: str, size: Optional[int] = None,
+                       progress: Optional[ProgressCallback] = None) -> int:
+        """Downloads `url` to `path` and returns its size in bytes."""
+        if size is None:
+            size = await self.probe_size(url)
+            if size is None:
+                raise DownloadError("server does not support range requests")
+        done = 0
+
+        def on_bytes(count: int) -> None:
+            nonlocal done
+            done += count
+            download_bytes.inc(count)
+            if progress is not None:
+                progress(done, size)
+
+        tmp = path + ".part"
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            pending = asyncio.Queue()
+            for byte_range in self.ranges(size):
+                pending.put_nowait(byte_range)
+
+            async def fetch_parts():
+                while not pending.empty():
+                    start, end = pending.get_nowait()
+                    await self._fetch_range(url, fd, start, end, on_bytes)
+
+            workers = [asyncio.create_task(fetch_parts())
+                       for _ in range(min(self.connections_per_job, pending.qsize()))]
+            try:
+                await asyncio.gather(*workers)
+            except BaseException:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                raise
+            if done != size or os.fstat(fd).st_size != size:
+                raise DownloadError(f"expected {size} bytes, got {done}")
+            os.fsync(fd)
+        except BaseException:
+            os.close(fd)
+            os.remove(tmp)
+            raise
+        os.close(fd)
+        os.replace(tmp, path)
+        return size
+
+
+downloader = RangedDownloader(
+    max_connections=settings.downloader_max_connections,
+    connections_per_job=settings.downloader_connections_per_job,
+    part_size=settings.downloader_part_size,
+    bandwidth=settings.downloader_bandwidth,
+    retries=settings.downloader_retries,
+    retry_backoff=settings.downloader_retry_backoff,
+)
+
+
+async def download_video(source: str, video_id: str, fmt: str, path: str,
+                         progress: Optional[ProgressCallback] = None) -> int:
+    """Resolves the stream with the source's get_stream() and downloads it to `path`."""
+    from service.youtube_service import YoutubeService
+    from service.instagram_service import InstagramService
+    services = {service.name: service for service in (YoutubeService, InstagramService)}
+    if source not in services:
+        raise DownloadError(f"unknown source {source}")
+    service = services[source](video_id, fmt)
+    info = await service.fetch_video_info()
+    return await downloader.download(info["url"], path, progress=progress)
+
+
+def print_progress(name: str) -> ProgressCallback:
+    last = [-1]
+
+    def report(done: int, total: int) -> None:
+        percent = done * 100 // total
+        if percent != last[0]:
+            last[0] = percent
+            print(f"{name}: {percent}% ({done}/{total} bytes)", file=sys.stderr)
+
+    return report
+
+
+async def run_queue(items: List[Tuple[str, ...]], output_dir: str, jobs: int) -> int:
+    """Downloads every (source, video_id, fmt) with `jobs` files in flight. Returns the number of failures."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    failures = 0
+
+    async def work():
+        nonlocal failures
+        while not queue.empty():
+            item = queue.get_nowait()
+            name = " ".join(item)
+            try:
+                # a malformed line fails on its own instead of stopping the worker
+                source, video_id, fmt = item
+                name = f"{source}-{video_id}.{fmt}"
+                await download_video(source, video_id, fmt, os.path.join(output_dir, name), print_progress(name))
+            except Exception as e:
+                failures += 1
+                logger.error(f"Impossible to download {name}, reason <{str(e)}>")
+                print(f"{name}: failed, {e}", file=sys.stderr)
+
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        await asyncio.gather(*(work() for _ in range(jobs)))
+    finally:
+        await downloader.close()
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("item", nargs="*", help="source video_id fmt")
+    parser.add_argument("-o", "--output", help="output file for a single video")
+    parser.add_argument("--input", help="file with one 'source video_id fmt' per line")
+    parser.add_argument("--output-dir", default=".", help="directory for downloads from --input")
+    parser.add_argument("--jobs", type=int, default=2, help="files downloaded at once")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input) as f:
+            items = [tuple(line.split()) for line in f if line.strip()]
+        return 1 if asyncio.run(run_queue(items, args.output_dir, args.jobs)) else 0
+    if len(args.item) != 3:
+        parser.error("expected: source video_id fmt")
+    source, video_id, fmt = args.item
+
+    async def single():
+        try:
+            path = args.output or f"{source}-{video_id}.{fmt}"
+            return await download_video(source, video_id, fmt, path, print_progress(path))
+        finally:
+            await downloader.close()
+
+    asyncio.run(single())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from settings import settings
+from metrics import extraction_queue_depth, extraction_wait_seconds, extraction_run_seconds
+
+
+class ExtractionExecutor:
+    """
+    Application-wide thread pool for blocking extractors (pytubefix, instaloader).
+    Each source gets its own concurrency cap so one slow upstream can't occupy
+    every worker thread.
+    """
+
+    def __init__(self, max_workers: int, limits: Dict[str, int]) -> None:
+        self.max_workers = max_workers
+        self.limits = limits
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting: Dict[str, int] = {}
+
+    def start(self) -> None:
+        if self._pool is not None:
+            return
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="extraction")
+        self._semaphores = {source: asyncio.Semaphore(limit) for source, limit in self.limits.items()}
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def queue_depth(self, source: Optional[str] = None) -> int:
+        if source is not None:
+            return self._waiting.get(source, 0)
+        return sum(self._waiting.values())
+
+    def _semaphore(self, source: str) -> asyncio.Semaphore:
+        if source not in self._semaphores:
+            self._semaphores[source] = asyncio.Semaphore(self.limits.get(source, self.max_workers))
+        return self._semaphores[source]
+
+    async def run(self, source: str, fn: Callable[..., Any], *args) -> Any:
+        self.start()
+        queued_at = time.perf_counter()
+        self._waiting[source] = self._waiting.get(source, 0) + 1
+        extraction_queue_depth.labels(source=source).inc()
+        try:
+            await self._semaphore(source).acquire()
+        finally:
+            self._waiting[source] -= 1
+            extraction_queue_depth.labels(source=source).dec()
+
+        try:
+            started_at = time.perf_counter()
+            extraction_wait_seconds.labels(source=source).observe(started_at - queued_at)
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._pool, fn, *args)
+            finally:
+                extraction_run_seconds.labels(source=source).observe(time.perf_counter() - started_at)
+        finally:
+            self._semaphore(source).release()
+
+
+extraction_executor = ExtractionExecutor(
+    max_workers=settings.extraction_max_workers,
+    limits={
+        "youtube": settings.youtube_max_concurrency,
+        "instagram": settings.instagram_max_concurrency,
+    },
+)
@@ -1,16 +1,163 @@
+import os
+import asyncio
+import threading
+from contextlib import contextmanager
 from fastapi import HTTPException
-from typing import Optional, Annotated
-from utils import BaseService
-import instaloader
+from typing import Optional, Annotated, List, Set
+from utils import BaseService, VideoUnavailable, compile_pattern
+from schemas.manifest import VideoManifest, StreamInfo
+from service.executor import extraction_executor
+from logger import get_logger
 from settings import settings
 
+logger = get_logger('api_logger.log')
+
+SHORTCODE_PATTERN = r"^[A-Za-z0-9_-]{5,40}$"
+
+
+class InstaloaderPool:
+    """
+    Logged-in Instaloader instances shared by all Instagram requests.
+    Sessions are saved to `session_dir`, so a restart reuses them instead of
+    logging in again. A request leases one instance for the duration of its
+    call and blocks while all `size` instances are in use. A waiter is woken
+    when an instance is returned or when creating one fails, so it can try
+    to create it in turn.
+    """
+
+    def __init__(self, size: int, session_dir: str, username: str = "", password: str = "") -> None:
+        self.size = size
+        self.session_dir = session_dir
+        self.username = username
+        self.password = password
+        self._idle: List = []
+        self._indexes: Set[int] = set()
+        self._changed = threading.Condition()
+
+    def _session_file(self, index: int) -> str:
+        return os.path.join(self.session_dir, f"{self.username}-{index}")
+
+    def _login(self, loader, index: int) -> None:
+        loader.login(self.username, self.password)
+        os.makedirs(self.session_dir, exist_ok=True)
+        loader.save_session_to_file(self._session_file(index))
+        logger.info(f"Instagram session {index} logged in")
+
+    def _create(self, index: int):
+        # instaloader is imported on first use to keep it off the startup path
+        import instaloader
+        loader = instaloader.Instaloader(quiet=True, max_connection_attempts=1)
+        loader.pool_index = index
+        if not self.username:
+            return loader
+        try:
+            loader.load_session_from_file(self.username, self._session_file(index))
+        except FileNotFoundError:
+            self._login(loader, index)
+        return loader
+
+    def _put(self, loader) -> None:
+        with self._changed:
+            self._idle.append(loader)
+            self._changed.notify()
+
+    def _take(self):
+        """An idle instance, or None with a free index reserved for creating one."""
+        with self._changed:
+            while True:
+                if self._idle:
+                    return self._idle.pop(), None
+                if len(self._indexes) < self.size:
+                    index = min(set(range(self.size)) - self._indexes)
+                    self._indexes.add(index)
+                    return None, index
+                self._changed.wait()
+
+    @contextmanager
+    def lease(self):
+        from instaloader.exceptions import LoginRequiredException
+        loader, index = self._take()
+        if loader is None:
+            try:
+                loader = self._create(index)
+            except Exception:
+                with self._changed:
+                    self._indexes.discard(index)
+                    self._changed.notify()
+                raise
+        try:
+            yield loader
+        except LoginRequiredException:
+            # the session expired under us: log in again before handing it out
+            try:
+                self._login(loader, loader.pool_index)
+            except Exception as e:
+                logger.error(f"Impossible to refresh Instagram session, reason <{str(e)}>")
+            raise
+        finally:
+            self._put(loader)
+
+    def refresh(self) -> None:
+        """
+        Checks the idle sessions and logs in again those that have expired.
+        One session is taken out at a time, so leases go on meanwhile.
+        """
+        if not self.username:
+            return
+        checked: Set[int] = set()
+        while True:
+            with self._changed:
+                loader = next((loader for loader in self._idle if loader.pool_index not in checked), None)
+                if loader is None:
+                    return
+                self._idle.remove(loader)
+            checked.add(loader.pool_index)
+            try:
+                if loader.test_login() is None:
+                    self._login(loader, loader.pool_index)
+            except Exception as e:
+                logger.error(f"Impossible to refresh Instagram session, reason <{str(e)}>")
+            finally:
+                self._put(loader)
+
+
+instaloader_pool = InstaloaderPool(settings.instagram_pool_size, settings.instagram_session_dir,
+                                   username=settings.instagram_user, password=settings.instagram_password)
+
+
+async def refresh_instagram_sessions() -> None:
+    while True:
+        await asyncio.sleep(settings.instagram_session_check_interval)
+        try:
+            await extraction_executor.run(InstagramService.name, instaloader_pool.refresh)
+        except Exception as e:
+            logger.error(f"Have error in refresh_instagram_sessions(), reason <{str(e)}>")
+
+
 class InstagramService(BaseService):
+    name = "instagram"
+    id_pattern = compile_pattern(settings.instagram_shortcode_pattern or SHORTCODE_PATTERN)
 
-    def get_stream(self):
+    def get_manifest(self) -> VideoManifest:
+        import instaloader
+        from instaloader.exceptions import QueryReturnedNotFoundException, PrivateProfileNotFollowedException
         try:
-            loader = instaloader.Instaloader()
-            loader.login(settings.instagram_user, settings.instagram_password)
-            post = instaloader.Post.from_shortcode(loader.context, self.content_id)
-            return post
+            with instaloader_pool.lease() as loader:
+                post = instaloader.Post.from_shortcode(loader.context, self.content_id)
+                if not post.is_video:
+                    raise VideoUnavailable(status_code=422, detail="Post has no video")
+                return VideoManifest(
+                    source=self.name,
+                    video_id=self.content_id,
+                    title=post.title or (post.caption or "")[:100],
+                    duration=int(post.video_duration) if post.video_duration else None,
+                    streams=[StreamInfo(mime_type="video/mp4", subtype="mp4", url=post.video_url)],
+                )
+        except HTTPException:
+            raise
+        except QueryReturnedNotFoundException:
+            raise VideoUnavailable(status_code=404, detail="Video not found")
+        except PrivateProfileNotFollowedException:
+            raise VideoUnavailable(status_code=404, detail="Video is private")
         except Exception as e:
-            raise HTTPException(status_code=422, detail=str(e))
\ No newline at end of file
+            raise HTTPException(status_code=422, detail=str(e))
@@ -0,0 +1,224 @@
+import time
+import uuid
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+import redis.asyncio as redis
+from fastapi import HTTPException, status
+from logger import get_logger
+from settings import settings
+from schemas.job import Job
+from metrics import job_seconds
+
+logger = get_logger('api_logger.log')
+
+JOB_QUEUE = "jobs:queue"
+JOB_WORKERS = "jobs:workers"
+
+
+class JobService:
+    """
+    Extraction jobs kept in Redis. A job is stored under `job:{id}` for `ttl`
+    seconds, its id is pushed to JOB_QUEUE, and every state change is
+    published on `job:{id}:events`. Workers in the API process or in
+    job_worker.py on other nodes move ids from the queue to their own
+    processing list and remove them once the job is finished. A worker that
+    is stopped puts its running jobs back in the queue; the jobs of a worker
+    whose heartbeat expired are put back by the other workers.
+    """
+
+    def __init__(self, ttl: int, heartbeat_ttl: int = 30) -> None:
+        self._redis = redis.from_url(settings.redis_url, db=0)
+        self.ttl = ttl
+        self.heartbeat_ttl = heartbeat_ttl
+        self.worker_id = uuid.uuid4().hex
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    @staticmethod
+    def _channel(job_id: str) -> str:
+        return f"job:{job_id}:events"
+
+    @staticmethod
+    def _processing(worker_id: str) -> str:
+        return f"jobs:processing:{worker_id}"
+
+    @staticmethod
+    def _alive(worker_id: str) -> str:
+        return f"jobs:worker:{worker_id}"
+
+    async def save(self, job: Job) -> None:
+        data = job.model_dump_json()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._key(job.id), data, ex=self.ttl)
+            pipe.publish(self._channel(job.id), data)
+            await pipe.execute()
+
+    async def submit(self, job: Job) -> None:
+        """Stores the job and queues it for a worker. Raises 503 when the queue is full or Redis is down."""
+        try:
+            if await self._redis.llen(JOB_QUEUE) >= settings.job_max_queue:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Service is overloaded, try again later",
+                                    headers={"Retry-After": str(settings.extraction_shed_retry_after)})
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.set(self._key(job.id), job.model_dump_json(), ex=self.ttl)
+                pipe.lpush(JOB_QUEUE, job.id)
+                await pipe.execute()
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f'Have error in submit(), reason <{str(e)}>')
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Job queue is unavailable")
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        data = await self._redis.get(self._key(job_id))
+        return Job.model_validate_json(data) if data else None
+
+    async def update(self, job: Job, **changes) -> Job:
+        job = job.model_copy(update={**changes, "updated_at": time.time()})
+        await self.save(job)
+        if job.finished:
+            job_seconds.labels(kind=job.kind, status=job.status).observe(job.updated_at - job.created_at)
+        return job
+
+    async def queue_length(self) -> int:
+        return await self._redis.llen(JOB_QUEUE)
+
+    async def next_job(self, timeout: float) -> Optional[Job]:
+        """
+        Moves the next queued job to this worker's processing list, waiting up
+        to `timeout` seconds. Expired jobs are dropped.
+        """
+        processing = self._processing(self.worker_id)
+        job_id = await self._redis.brpoplpush(JOB_QUEUE, processing, timeout)
+        if job_id is None:
+            return None
+        job = await self.get(job_id.decode())
+        if job is None:
+            await self._redis.lrem(processing, 1, job_id)
+        return job
+
+    async def _requeue(self, job: Job) -> None:
+        job = job.model_copy(update={"status": "queued", "updated_at": time.time()})
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self._processing(self.worker_id), 1, job.id)
+            pipe.rpush(JOB_QUEUE, job.id)
+            pipe.set(self._key(job.id), job.model_dump_json(), ex=self.ttl)
+            pipe.publish(self._channel(job.id), job.model_dump_json())
+            await pipe.execute()
+
+    async def process(self, job: Job, handler: Callable[[Job], Awaitable[Job]]) -> Job:
+        """Runs the job and removes it from the processing list. A cancelled job goes back to the queue."""
+        cancelled = False
+        try:
+            job = await self.update(job, status="running")
+            try:
+                return await handler(job)
+            except HTTPException as e:
+                return await self.update(job, status="failed", status_code=e.status_code, detail=e.detail)
+            except Exception as e:
+                logger.error(f"Job {job.id} failed, reason <{str(e)}>")
+                return await self.update(job, status="failed", status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                         detail="Extraction failed")
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if cancelled:
+                await self._requeue(job)
+            else:
+                await self._redis.lrem(self._processing(self.worker_id), 1, job.id)
+
+    async def requeue_stale(self) -> int:
+        """Puts the jobs of workers whose heartbeat expired back in the queue. Returns how many."""
+        moved = 0
+        for worker_id in await self._redis.smembers(JOB_WORKERS):
+            worker_id = worker_id.decode()
+            if await self._redis.exists(self._alive(worker_id)):
+                continue
+            while await self._redis.lmove(self._processing(worker_id), JOB_QUEUE, "LEFT", "RIGHT"):
+                moved += 1
+            await self._redis.srem(JOB_WORKERS, worker_id)
+        if moved:
+            logger.warning(f"Requeued {moved} jobs of stopped job workers")
+        return moved
+
+    async def _beat(self) -> None:
+        while True:
+            try:
+                await self._redis.set(self._alive(self.worker_id), 1, ex=self.heartbeat_ttl)
+                await self._redis.sadd(JOB_WORKERS, self.worker_id)
+                await self.requeue_stale()
+            except Exception as e:
+                logger.error(f'Have error in job worker heartbeat, reason <{str(e)}>')
+            await asyncio.sleep(self.heartbeat_ttl / 3)
+
+    async def _work(self, handler: Callable[[Job], Awaitable[Job]]) -> None:
+        while True:
+            try:
+                job = await self.next_job(timeout=settings.job_poll_timeout)
+                if job is not None:
+                    await self.process(job, handler)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'Have error in job worker, reason <{str(e)}>')
+                await asyncio.sleep(settings.job_poll_timeout)
+
+    def start(self, handler: Callable[[Job], Awaitable[Job]], workers: int) -> None:
+        if not self._workers and workers > 0:
+            self._heartbeat = asyncio.create_task(self._beat())
+            self._workers = [asyncio.create_task(self._work(handler)) for _ in range(workers)]
+
+    async def stop(self) -> None:
+        """Stops the workers. Jobs they were running go back to the queue for another worker."""
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers, self._heartbeat = [], None
+        try:
+            while await self._redis.lmove(self._processing(self.worker_id), JOB_QUEUE, "LEFT", "RIGHT"):
+                pass
+            await self._redis.delete(self._alive(self.worker_id))
+            await self._redis.srem(JOB_WORKERS, self.worker_id)
+        except Exception as e:
+            logger.error(f'Have error in stop(), reason <{str(e)}>')
+
+    async def events(self, job_id: str, keepalive: float, timeout: float) -> AsyncIterator[Optional[Job]]:
+        """
+        Yields the job now and on every change until it finishes or `timeout`
+        passes. Yields None every `keepalive` seconds without a change.
+        """
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self._channel(job_id))
+        try:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            yield job
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            last_event = loop.time()
+            while not job.finished and loop.time() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                                   timeout=min(keepalive, deadline - loop.time()))
+                if message is not None:
+                    job = Job.model_validate_json(message["data"])
+                    last_event = loop.time()
+                    yield job
+                elif loop.time() - last_event >= keepalive:
+                    last_event = loop.time()
+                    yield None
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+
+job_service = JobService(settings.job_ttl, settings.job_heartbeat_ttl)
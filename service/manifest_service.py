@@ -0,0 +1,168 @@
+"""
+Manifest extraction and the job handler, shared by the API and job_worker.py
+so a worker node does not import the FastAPI app.
+"""
+import json
+import asyncio
+from enum import Enum
+from typing import Optional
+from fastapi import status
+from logger import get_logger
+from settings import settings
+from schemas.job import Job
+from schemas.manifest import VideoManifest, MANIFEST_VERSION
+from service.redis_service import redis_pool
+from service.youtube_service import YoutubeService
+from service.instagram_service import InstagramService
+from service.rabbitmq_service import publish_message
+from service.singleflight import SingleFlight
+from service.job_service import job_service
+from utils import manifest_cache_ttl, manifest_refresh_ahead, LazyTask, VideoUnavailable
+from metrics import coalesced_requests, negative_cache_hits
+
+logger = get_logger('api_logger.log')
+
+# celery is only imported when the first email task is queued
+send_email = LazyTask("celery_worker", "send_email")
+
+
+class Source(Enum):
+    youtube = "youtube", YoutubeService
+    instagram = "instagram", InstagramService
+
+    def __init__(self, value, source_class):
+        self._value_ = value
+        self.source_class = source_class
+
+
+extractions = SingleFlight()
+revalidations: dict[str, asyncio.Task] = {}
+
+
+def manifest_key(source: Source, video_id: str) -> str:
+    return f"manifest:v{MANIFEST_VERSION}:{source.value}:{video_id}"
+
+
+def unavailable_key(source: Source, video_id: str) -> str:
+    return f"unavailable:{source.value}:{video_id}"
+
+
+async def remember_unavailable(source: Source, video_id: str, error: VideoUnavailable, redis) -> None:
+    value = json.dumps({"status_code": error.status_code, "detail": error.detail})
+    await redis.set_cache(key=unavailable_key(source, video_id), value=value, expire=settings.negative_cache_ttl)
+
+
+async def check_unavailable(source: Source, video_id: str, redis) -> None:
+    """
+    Negative cache: re-raises the not found, unavailable or private answer
+    cached for `negative_cache_ttl` seconds, so retries of a dead id skip
+    the rate limiter, the job queue and the extractor.
+    """
+    cache = await redis.get_cache(key=unavailable_key(source, video_id))
+    if cache:
+        negative_cache_hits.labels(source=source.value).inc()
+        raise VideoUnavailable(**json.loads(cache))
+
+
+async def _wait_for_extraction(lock_key: str, key: str, redis) -> Optional[VideoManifest]:
+    """
+    Waits for the replica holding `lock_key` to cache the manifest under `key`.
+    Returns None if the lock goes away without a result or the wait times out.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.extraction_lock_wait
+    while loop.time() < deadline:
+        cache = await redis.get_cache(key=key)
+        if cache:
+            return VideoManifest.model_validate_json(cache)
+        if not await redis.is_locked(lock_key):
+            return None
+        await asyncio.sleep(settings.extraction_lock_poll_interval)
+    return None
+
+
+async def _extract(source: Source, video_id: str, redis) -> VideoManifest:
+    key = manifest_key(source, video_id)
+    lock_key = f"lock:{key}"
+
+    token = await redis.acquire_lock(lock_key, settings.extraction_lock_ttl)
+    if not token:
+        manifest = await _wait_for_extraction(lock_key, key, redis)
+        if manifest is not None:
+            coalesced_requests.labels(source=source.value, scope="replica").inc()
+            return manifest
+    try:
+        service = source.source_class(video_id)
+        try:
+            manifest = await service.fetch_manifest()
+        except VideoUnavailable as e:
+            await remember_unavailable(source, video_id, e, redis)
+            raise
+        ttl = manifest_cache_ttl(manifest)
+        if ttl > 0:
+            await redis.set_cache(key=key, value=manifest.model_dump_json(), expire=ttl)
+        return manifest
+    finally:
+        if token:
+            await redis.release_lock(lock_key, token)
+
+
+async def extract_manifest(source: Source, video_id: str, redis) -> VideoManifest:
+    """
+    Extracts the manifest once per (source, video_id), no matter how many
+    requests ask for it concurrently on this or other API replicas.
+    """
+    manifest, shared = await extractions.do((source, video_id), lambda: _extract(source, video_id, redis))
+    if shared:
+        coalesced_requests.labels(source=source.value, scope="local").inc()
+    return manifest
+
+
+async def _revalidate(source: Source, video_id: str, redis) -> None:
+    try:
+        await extract_manifest(source, video_id, redis)
+    except Exception as e:
+        logger.error(f"Impossible to revalidate {manifest_key(source, video_id)}, reason <{str(e)}>")
+
+
+def revalidate_if_stale(ttl: Optional[float], manifest: VideoManifest, source: Source, video_id: str,
+                        redis) -> None:
+    """
+    Stale-while-revalidate: when a cached manifest is close to expiry, it is still
+    served, and a single background task per video re-extracts and re-caches it.
+    """
+    if not settings.cache_stale_while_revalidate or ttl is None or ttl > manifest_refresh_ahead(manifest):
+        return
+    key = manifest_key(source, video_id)
+    if key in revalidations:
+        return
+    task = asyncio.create_task(_revalidate(source, video_id, redis))
+    revalidations[key] = task
+    task.add_done_callback(lambda _: revalidations.pop(key, None))
+
+
+async def finish_job(job: Job, manifest: VideoManifest) -> Job:
+    """Selects the job's stream, emails it as before and stores it as the job result."""
+    service = Source[job.source].source_class(job.video_id, job.fmt)
+    return await deliver_job(job, manifest.video_info(service.select_stream(manifest)))
+
+
+async def deliver_job(job: Job, info: dict) -> Job:
+    if job.kind == "download_link":
+        await publish_message(info["url"], job.email)
+    else:
+        send_email.delay(recipient=job.email, subject="Video metadata", body=json.dumps(info),
+                         enqueued_at=job.created_at)
+    return await job_service.update(job, status="done", status_code=status.HTTP_200_OK, result=info)
+
+
+async def run_job(job: Job, redis=redis_pool) -> Job:
+    """Job worker handler. The manifest may have been cached by another job while this one was queued."""
+    source = Source[job.source]
+    cache = await redis.get_cache(key=manifest_key(source, job.video_id))
+    if cache:
+        manifest = VideoManifest.model_validate_json(cache)
+    else:
+        await check_unavailable(source, job.video_id, redis)
+        manifest = await extract_manifest(source, job.video_id, redis)
+    return await finish_job(job, manifest)
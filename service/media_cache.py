@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from starlette.responses import FileResponse
+from logger import get_logger
+from settings import settings
+from metrics import media_cache_evictions, media_cache_fills, media_cache_size_bytes
+
+logger = get_logger('api_logger.log')
+
+INDEX_FILE = "index.json"
+MEDIA_SUFFIX = ".media"
+PART_SUFFIX = ".part"
+
+CacheKey = Tuple[str, str, str]
+
+
+class MediaCache:
+    """
+    Media files on local disk, keyed by (source, video_id, fmt) and bounded by
+    `max_bytes` with LRU eviction. Files are downloaded in the background to
+    a `.part` file and renamed into place once complete, and the index is
+    rewritten the same way, so a crash never leaves a partial file indexed.
+    Files being served are pinned and skipped by eviction. The directory
+    must belong to one process: two processes would evict each other's files.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_file_bytes: int, fill_concurrency: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.fill_concurrency = fill_concurrency
+        self.size = 0
+        self._entries: OrderedDict[str, Dict] = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._fills: Dict[str, asyncio.Task] = {}
+        self._fill_slots: Optional[asyncio.Semaphore] = None
+
+    @staticmethod
+    def _name(key: CacheKey) -> str:
+        return hashlib.sha256(":".join(key).encode()).hexdigest()[:32] + MEDIA_SUFFIX
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def start(self) -> None:
+        """Loads the index, dropping entries without a file and cache files without an entry."""
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self.path(INDEX_FILE)) as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            entries = {}
+        for name, entry in sorted(entries.items(), key=lambda item: item[1]["last_access"]):
+            if os.path.exists(self.path(name)):
+                self._entries[name] = entry
+                self.size += entry["size"]
+        for name in os.listdir(self.directory):
+            if name.endswith((MEDIA_SUFFIX, MEDIA_SUFFIX + PART_SUFFIX)) and name not in self._entries \
+                    and os.path.isfile(self.path(name)):
+                os.remove(self.path(name))
+        media_cache_size_bytes.set(self.size)
+
+    async def close(self) -> None:
+        for task in self._fills.values():
+            task.cancel()
+        await asyncio.gather(*self._fills.values(), return_exceptions=True)
+        self._save_index()
+
+    def _save_index(self) -> None:
+        tmp = self.path(INDEX_FILE + PART_SUFFIX)
+        with open(tmp, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path(INDEX_FILE))
+
+    def lookup(self, key: CacheKey) -> Optional[Tuple[str, Dict]]:
+        """Returns the file path and its entry, and marks it as recently used."""
+        name = self._name(key)
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        entry["last_access"] = time.time()
+        entry["hits"] += 1
+        self._entries.move_to_end(name)
+        return self.path(name), entry
+
+    def pin(self, path: str) -> None:
+        """Keeps the file at `path` from being evicted until it is unpinned."""
+        name = os.path.basename(path)
+        self._pins[name] = self._pins.get(name, 0) + 1
+
+    def unpin(self, path: str) -> None:
+        name = os.path.basename(path)
+        self._pins[name] -= 1
+        if not self._pins[name]:
+            del self._pins[name]
+            self._evict()
+
+    def _evict(self) -> None:
+        for name in list(self._entries):
+            if self.size <= self.max_bytes:
+                break
+            if name in self._pins:
+                continue
+            entry = self._entries.pop(name)
+            self.size -= entry["size"]
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            media_cache_evictions.inc()
+        media_cache_size_bytes.set(self.size)
+
+    def schedule_fill(self, key: CacheKey, url: str, content_type: str, session,
+                      filesize: Optional[int] = None) -> None:
+        """Starts downloading `url` into the cache unless it is cached, already filling or too big."""
+        name = self._name(key)
+        if name in self._entries or name in self._fills:
+            return
+        if filesize is not None and filesize > self.max_file_bytes:
+            media_cache_fills.labels(result="too_big").inc()
+            return
+        task = asyncio.create_task(self._fill(name, url, content_type, session))
+        self._fills[name] = task
+        task.add_done_callback(lambda _: self._fills.pop(name, None))
+
+    async def _fill(self, name: str, url: str, content_type: str, session) -> None:
+        if self._fill_slots is None:
+            self._fill_slots = asyncio.Semaphore(self.fill_concurrency)
+        tmp = self.path(name + PART_SUFFIX)
+        result = "error"
+        try:
+            async with self._fill_slots, session.get(url) as response:
+                if response.status != 200:
+                    raise ValueError(f"upstream answered {response.status}")
+                size = 0
+                with open(tmp, "wb") as f:
+                    async for chunk in response.content.iter_chunked(settings.proxy_chunk_size):
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            result = "too_big"
+                            return
+                        await asyncio.to_thread(f.write, chunk)
+            os.replace(tmp, self.path(name))
+            self._entries[name] = {"size": size, "content_type": content_type,
+                                   "last_access": time.time(), "hits": 0}
+            self.size += size
+            self._evict()
+            await asyncio.to_thread(self._save_index)
+            media_cache_size_bytes.set(self.size)
+            result = "ok"
+        except asyncio.CancelledError:
+            result = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Impossible to cache {url}, reason <{str(e)}>")
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            media_cache_fills.labels(result=result).inc()
+
+
+class CachedFileResponse(FileResponse):
+    """Serves a cached file, pinned against eviction until the response ends."""
+
+    def __init__(self, cache: MediaCache, path: str, entry: Dict) -> None:
+        super().__init__(path, media_type=entry["content_type"])
+        self.cache = cache
+        self.released = False
+        cache.pin(path)
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.cache.unpin(self.path)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+def served_bytes(range_header: Optional[str], size: int) -> int:
+    """Bytes a FileResponse sends for a single `bytes=start-end` range, or the whole file."""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return size
+    start, _, end = range_header[len("bytes="):].partition("-")
+    try:
+        if not start:
+            return min(int(end), size)
+        end = min(int(end), size - 1) if end else size - 1
+        return max(0, end - int(start) + 1)
+    except ValueError:
+        return size
+
+
+media_cache = MediaCache(
+    directory=settings.media_cache_dir,
+    max_bytes=settings.media_cache_max_bytes,
+    max_file_bytes=settings.media_cache_max_file_bytes,
+    fill_concurrency=settings.media_cache_fill_concurrency,
+)
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from settings import settings
+from metrics import password_queue_depth, password_seconds, password_rejected
+
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Returns whether the password matches, and a new hash if the stored one uses outdated settings."""
+    return pwd_context.verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a small process pool so hashing never blocks the event loop.
+    At most `workers` operations run at once and at most `max_queue` wait for a
+    slot; beyond that requests are rejected with 503 instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+
+    def start(self) -> None:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, operation: str, fn, *args):
+        self.start()
+        if self._waiting >= self.max_queue:
+            password_rejected.labels(operation=operation).inc()
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many authentication requests, retry later",
+                                headers={"Retry-After": "1"})
+        self._waiting += 1
+        password_queue_depth.inc()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+            password_queue_depth.dec()
+        try:
+            started_at = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._pool, fn, *args)
+            finally:
+                password_seconds.labels(operation=operation).observe(time.perf_counter() - started_at)
+        finally:
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        return await self._run("verify", verify_and_update, password, hashed)
+
+
+password_hasher = PasswordHasher(settings.password_workers, settings.password_max_queue)
@@ -0,0 +1,115 @@
+import asyncio
+from typing import AsyncIterator, Dict, Mapping
+from starlette.responses import StreamingResponse
+from logger import get_logger
+from settings import settings
+from metrics import proxy_bytes, proxy_active_downloads
+
+logger = get_logger('api_logger.log')
+
+REQUEST_HEADERS = ("Range", "If-Range")
+RESPONSE_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified")
+PASSTHROUGH_STATUSES = (200, 206, 412, 416)
+
+
+class StreamProxy:
+    """
+    Streams upstream media through the API over one pooled aiohttp session.
+    Bodies are relayed in chunks of `chunk_size` bytes, so memory per
+    download stays flat, and at most `max_concurrency` downloads run at once.
+    """
+
+    def __init__(self, chunk_size: int, max_concurrency: int, pool_size: int,
+                 connect_timeout: float, read_timeout: float) -> None:
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.active = 0
+        self._session = None
+
+    def session(self):
+        # aiohttp is imported on the first download to keep it off the startup path
+        import aiohttp
+        if self._session is None or self._session.closed:
+            timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=timeout,
+                auto_decompress=False,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def try_acquire(self) -> bool:
+        """Takes a download slot without waiting. Returns False when all are in use."""
+        if self.active >= self.max_concurrency:
+            return False
+        self.active += 1
+        proxy_active_downloads.inc()
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+        proxy_active_downloads.dec()
+
+    async def open(self, url: str, headers: Mapping[str, str]):
+        """Sends the request upstream with the client's Range/If-Range headers and returns the response."""
+        forwarded = {name: headers[name] for name in REQUEST_HEADERS if name in headers}
+        return await self.session().get(url, headers=forwarded)
+
+    @staticmethod
+    def response_headers(response) -> Dict[str, str]:
+        return {name: response.headers[name] for name in RESPONSE_HEADERS if name in response.headers}
+
+    async def iter_body(self, response, source: str) -> AsyncIterator[bytes]:
+        """Relays the body in fixed-size chunks; a dropped upstream ends the body early."""
+        counter = proxy_bytes.labels(source=source)
+        try:
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                counter.inc(len(chunk))
+                yield chunk
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.error(f"Proxied download interrupted, reason <{str(e)}>")
+
+
+class ProxyResponse(StreamingResponse):
+    """
+    Relays an upstream response that holds a download slot. The upstream
+    connection and the slot are freed once the response ends, even when the
+    client goes away before the body starts.
+    """
+
+    def __init__(self, proxy: StreamProxy, upstream, source: str) -> None:
+        super().__init__(proxy.iter_body(upstream, source), status_code=upstream.status,
+                         headers=proxy.response_headers(upstream))
+        self.proxy = proxy
+        self.upstream = upstream
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self.upstream.release()
+        self.proxy.release()
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+stream_proxy = StreamProxy(
+    chunk_size=settings.proxy_chunk_size,
+    max_concurrency=settings.proxy_max_concurrency,
+    pool_size=settings.proxy_pool_size,
+    connect_timeout=settings.proxy_connect_timeout,
+    read_timeout=settings.proxy_read_timeout,
+)
@@ -1,23 +1,148 @@
 import json
-import aio_pika
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+from logger import get_logger
 from settings import settings
+from metrics import publish_seconds
 
 
-async def get_rabbit_connection():
-    return await aio_pika.connect_robust(settings.rabbitmq_url)
+logger = get_logger('api_logger.log')
+
+EMAIL_QUEUE = "email_queue"
+
+
+class RabbitPublisher:
+    """
+    Keeps one robust connection and a pool of confirm-mode channels for the
+    lifetime of the app. With a batch window set, messages published within
+    the window are sent together and their confirms awaited as one batch.
+    Connecting gives up after `connect_timeout` seconds, so a broker that is
+    down fails the publish instead of blocking it.
+    """
+
+    def __init__(self, url: str, channel_pool_size: int = 4,
+                 batch_window_ms: float = 0, batch_max_size: int = 100,
+                 connect_timeout: float = 5.0) -> None:
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self.channel_pool_size = channel_pool_size
+        self.batch_window = batch_window_ms / 1000
+        self.batch_max_size = batch_max_size
+        self._connection = None
+        self._channels = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._pending: List[Tuple[Any, str, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        # aio_pika is imported on first connect to keep it off the startup path
+        import aio_pika
+        from aio_pika.pool import Pool
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._connection is not None:
+                return
+            connection = aio_pika.RobustConnection(self.url)
+            try:
+                await asyncio.wait_for(connection.connect(), self.connect_timeout)
+            except BaseException:
+                # closing stops the reconnect loop a robust connection keeps running after a failed connect
+                await connection.close()
+                raise
+            channels = Pool(self._open_channel, connection, max_size=self.channel_pool_size)
+            async with channels.acquire() as channel:
+                await channel.declare_queue(EMAIL_QUEUE)
+            self._connection, self._channels = connection, channels
+
+    async def close(self) -> None:
+        await asyncio.gather(*filter(None, [self._flush_task, *self._flushes]))
+        if self._channels is not None:
+            await self._channels.close()
+        if self._connection is not None:
+            await self._connection.close()
+        self._connection, self._channels, self._start_lock = None, None, None
+
+    @staticmethod
+    async def _open_channel(connection):
+        return await connection.channel(publisher_confirms=True)
+
+    async def publish(self, payload: Dict[str, Any], routing_key: str = EMAIL_QUEUE) -> None:
+        started_at = time.perf_counter()
+        try:
+            await self._publish(payload, routing_key)
+        finally:
+            publish_seconds.labels(routing_key=routing_key).observe(time.perf_counter() - started_at)
+
+    async def _publish(self, payload: Dict[str, Any], routing_key: str) -> None:
+        import aio_pika
+        if self._connection is None:
+            await self.start()
+        message = aio_pika.Message(body=json.dumps(payload).encode())
+        if self.batch_window <= 0:
+            async with self._channels.acquire() as channel:
+                await channel.default_exchange.publish(message, routing_key=routing_key)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message, routing_key, future))
+        if len(self._pending) >= self.batch_max_size:
+            # in its own task, so cancelling this caller leaves the rest of the batch served
+            task = asyncio.create_task(self._flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        await future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.batch_window)
+        self._flush_task = None
+        await self._flush()
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        results = None
+        try:
+            async with self._channels.acquire() as channel:
+                results = await asyncio.gather(
+                    *(channel.default_exchange.publish(message, routing_key=routing_key)
+                      for message, routing_key, _ in batch),
+                    return_exceptions=True,
+                )
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            # a cancelled flush has no results: cancel the waiters instead of leaving them hanging
+            for index, (_, _, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if results is None:
+                    future.cancel()
+                elif isinstance(results[index], BaseException):
+                    future.set_exception(results[index])
+                else:
+                    future.set_result(None)
+
+rabbit_publisher = RabbitPublisher(
+    settings.rabbitmq_url,
+    channel_pool_size=settings.rabbitmq_channel_pool_size,
+    batch_window_ms=settings.rabbitmq_batch_window_ms,
+    batch_max_size=settings.rabbitmq_batch_max_size,
+    connect_timeout=settings.rabbitmq_connect_timeout,
+)
 
 
 async def publish_message(url: str, user_email: str):
-    connection = await get_rabbit_connection()
-    async with connection:
-        channel = await connection.channel()
-        message = {
-            "recipient": user_email,
-            "subject": "Ссылка на скачивание видео",
-            "body": f"Ссылка на скачивание вашего видео: {url}",
-            "attempts": 1
-        }
-        await channel.default_exchange.publish(
-            aio_pika.Message(body=json.dumps(message).encode()),
-            routing_key="email_queue",
-        )
\ No newline at end of file
+    message = {
+        "recipient": user_email,
+        "subject": "Ссылка на скачивание видео",
+        "body": f"Ссылка на скачивание вашего видео: {url}",
+        "attempts": 1,
+        "enqueued_at": time.time(),
+    }
+    await rabbit_publisher.publish(message)
@@ -1,29 +1,293 @@
 import os
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
 
 import redis.asyncio as redis
 from logger import get_logger
 from settings import settings
-from typing import Optional
+from typing import List, Optional, Tuple
+from metrics import cache_requests
 
 
 logger = get_logger('api_logger.log')
 
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Takes one token from every bucket in KEYS, or none if any bucket is empty.
+# ARGV holds a (capacity, refill per second) pair per key. Returns 0 when the
+# tokens were taken, otherwise the milliseconds until all buckets have one.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call("TIME")
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local available = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    available = math.min(capacity, available + math.max(0, now - ts) * rate / 1000)
+    if available < 1 then
+        wait = math.max(wait, math.ceil((1 - available) * 1000 / rate))
+    end
+    tokens[i] = available
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    redis.call("HSET", key, "tokens", tokens[i] - 1, "ts", now)
+    redis.call("PEXPIRE", key, math.ceil(capacity * 1000 / rate))
+end
+return 0
+"""
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+class LocalCache:
+    """
+    In-process TTL + LRU cache bounded by the total size of keys and values.
+    """
+
+    def __init__(self, max_bytes: int, max_ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self.size = 0
+        self._entries: OrderedDict[str, Tuple[bytes, float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_size(key: str, value: bytes) -> int:
+        return len(key) + len(value)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key: str) -> Tuple[Optional[bytes], Optional[float]]:
+        """Returns the value and the remaining TTL of the Redis key it was read from."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        value, expires_at, origin_expires_at = entry
+        now = time.monotonic()
+        if expires_at <= now:
+            self.pop(key)
+            return None, None
+        self._entries.move_to_end(key)
+        return value, origin_expires_at - now
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.pop(key)
+        size = self._entry_size(key, value)
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        now = time.monotonic()
+        self._entries[key] = (value, now + min(ttl, self.max_ttl), now + ttl)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest, (oldest_value, _, _) = self._entries.popitem(last=False)
+            self.size -= self._entry_size(oldest, oldest_value)
+
+    def pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= self._entry_size(key, entry[0])
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+
 class RedisService:
     def __init__(self) -> None:
         self._redis = redis.from_url(settings.redis_url, db=0)
+        self.replica_id = uuid.uuid4().hex
+        self.l1: Optional[LocalCache] = None
+        if settings.l1_cache_enabled:
+            self.l1 = LocalCache(settings.l1_cache_max_bytes, settings.l1_cache_max_ttl)
+        self._local_caches: List[LocalCache] = [self.l1] if self.l1 is not None else []
+        self._listener: Optional[asyncio.Task] = None
 
     async def set_cache(self, key, value, expire) -> None:
         try:
             await self._redis.set(name=key, value=value, ex=expire)
         except Exception as e:
             logger.error(f'Have error in set_cache(), reason <{str(e)}>')
+            return
+        if self.l1 is not None:
+            self.l1.set(key, value.encode() if isinstance(value, str) else value, expire)
+            await self._publish_invalidation(key)
+
+    async def delete_cache(self, key) -> None:
+        """Deletes a key from Redis and from the local caches of every replica."""
+        for cache in self._local_caches:
+            cache.pop(key)
+        try:
+            await self._redis.delete(key)
+        except Exception as e:
+            logger.error(f'Have error in delete_cache(), reason <{str(e)}>')
+        if self._local_caches:
+            await self._publish_invalidation(key)
 
     async def get_cache(self, key) -> bytes:
+        if self.l1 is not None:
+            return (await self.get_cache_with_ttl(key))[0]
         try:
-            return await self._redis.get(name=key)
+            value = await self._redis.get(name=key)
+            cache_requests.labels(layer="redis", result="hit" if value is not None else "miss").inc()
+            return value
         except Exception as e:
             logger.error(f'Have error in get_cache(), reason <{str(e)}>')
 
+    async def get_cache_with_ttl(self, key) -> Tuple[Optional[bytes], Optional[float]]:
+        """
+        Returns the cached value and its remaining TTL in seconds, read in one
+        round-trip. The TTL is None for missing keys and keys without expiry.
+        """
+        if self.l1 is not None:
+            value, ttl = self.l1.get_with_ttl(key)
+            cache_requests.labels(layer="l1", result="hit" if value is not None else "miss").inc()
+            if value is not None:
+                return value, ttl
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                value, ttl_ms = await pipe.get(key).pttl(key).execute()
+            cache_requests.labels(layer="redis", result="hit" if value is not None else "miss").inc()
+            if value is None or ttl_ms < 0:
+                return value, None
+            if self.l1 is not None:
+                self.l1.set(key, value, ttl_ms / 1000)
+            return value, ttl_ms / 1000
+        except Exception as e:
+            logger.error(f'Have error in get_cache_with_ttl(), reason <{str(e)}>')
+            return None, None
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Reads several keys at once: L1 first, then one MGET for the rest."""
+        values: List[Optional[bytes]] = [None] * len(keys)
+        missing = list(range(len(keys)))
+        if self.l1 is not None:
+            values = [self.l1.get(key) for key in keys]
+            missing = [i for i, value in enumerate(values) if value is None]
+            cache_requests.labels(layer="l1", result="hit").inc(len(keys) - len(missing))
+            cache_requests.labels(layer="l1", result="miss").inc(len(missing))
+        if not missing:
+            return values
+        try:
+            found = await self._redis.mget([keys[i] for i in missing])
+        except Exception as e:
+            logger.error(f'Have error in get_many(), reason <{str(e)}>')
+            return values
+        for i, value in zip(missing, found):
+            values[i] = value
+        hits = sum(value is not None for value in found)
+        cache_requests.labels(layer="redis", result="hit").inc(hits)
+        cache_requests.labels(layer="redis", result="miss").inc(len(found) - hits)
+        return values
+
+    async def _publish_invalidation(self, key) -> None:
+        try:
+            await self._redis.publish(INVALIDATION_CHANNEL, json.dumps({"origin": self.replica_id, "key": key}))
+        except Exception as e:
+            logger.error(f'Have error in _publish_invalidation(), reason <{str(e)}>')
+
+    def _on_invalidation(self, data: bytes) -> None:
+        message = json.loads(data)
+        if message["origin"] != self.replica_id:
+            for cache in self._local_caches:
+                cache.pop(message["key"])
+
+    async def _listen_invalidations(self) -> None:
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # writes made while we were not subscribed are unknown
+                    self._clear_local_caches()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._on_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'Have error in _listen_invalidations(), reason <{str(e)}>')
+                self._clear_local_caches()
+                await asyncio.sleep(1)
+
+    def _clear_local_caches(self) -> None:
+        for cache in self._local_caches:
+            cache.clear()
+
+    def register_local_cache(self, cache: LocalCache) -> None:
+        """Makes `cache` follow invalidations published by delete_cache() and set_cache()."""
+        self._local_caches.append(cache)
+
+    def start(self) -> None:
+        """Subscribes this replica's local caches to invalidations from the other replicas."""
+        if self._local_caches and self._listener is None:
+            self._listener = asyncio.create_task(self._listen_invalidations())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    async def acquire_lock(self, key, expire) -> Optional[str]:
+        """
+        Tries to take a short-lived lock shared by all API replicas.
+        Returns the lock token on success and None if the lock is held elsewhere
+        or Redis is unavailable.
+        """
+        token = uuid.uuid4().hex
+        try:
+            if await self._redis.set(name=key, value=token, ex=expire, nx=True):
+                return token
+        except Exception as e:
+            logger.error(f'Have error in acquire_lock(), reason <{str(e)}>')
+        return None
+
+    async def release_lock(self, key, token) -> None:
+        try:
+            await self._redis.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+        except Exception as e:
+            logger.error(f'Have error in release_lock(), reason <{str(e)}>')
+
+    async def is_locked(self, key) -> bool:
+        try:
+            return bool(await self._redis.exists(key))
+        except Exception as e:
+            logger.error(f'Have error in is_locked(), reason <{str(e)}>')
+            return False
+
+    async def take_tokens(self, buckets: List[Tuple[str, int, float]]) -> float:
+        """
+        Atomically takes one token from each (key, capacity, refill_per_second)
+        token bucket, or none of them. Returns 0 when allowed, otherwise the
+        seconds to wait. Requests are let through when Redis is unavailable.
+        """
+        args = [value for _, capacity, rate in buckets for value in (capacity, rate)]
+        try:
+            wait_ms = await self._redis.eval(TOKEN_BUCKET_SCRIPT, len(buckets),
+                                             *(key for key, _, _ in buckets), *args)
+        except Exception as e:
+            logger.error(f'Have error in take_tokens(), reason <{str(e)}>')
+            return 0
+        return int(wait_ms) / 1000
+
 
 redis_pool = RedisService()
 
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+from aiosmtplib import SMTP, SMTPServerDisconnected, SMTPConnectError
+from metrics import smtp_send_seconds
+
+
+RECONNECT_ERRORS = (SMTPServerDisconnected, SMTPConnectError, ConnectionError, asyncio.TimeoutError)
+
+
+class SMTPPool:
+    """
+    Pool of connected and logged-in SMTP sessions that are reused across
+    messages. Sessions idle for longer than `idle_timeout` seconds are closed,
+    and a session that drops mid-send is replaced by a fresh one once.
+    """
+
+    def __init__(self, hostname: str, port: int, username: str = "", password: str = "",
+                 max_size: int = 4, idle_timeout: float = 60) -> None:
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._idle: List[Tuple[SMTP, float]] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    @property
+    def size(self) -> int:
+        return len(self._idle)
+
+    def start(self) -> None:
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_forever())
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            await self._quit(smtp)
+
+    async def _connect(self) -> SMTP:
+        smtp = SMTP(hostname=self.hostname, port=self.port)
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password)
+        return smtp
+
+    @staticmethod
+    async def _quit(smtp: SMTP) -> None:
+        try:
+            await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def evict_idle(self) -> None:
+        now = time.monotonic()
+        expired = [smtp for smtp, released_at in self._idle if now - released_at > self.idle_timeout]
+        self._idle = [(smtp, released_at) for smtp, released_at in self._idle if smtp not in expired]
+        for smtp in expired:
+            await self._quit(smtp)
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.idle_timeout)
+            await self.evict_idle()
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_size)
+        async with self._semaphore:
+            await self.evict_idle()
+            smtp = None
+            while self._idle:
+                candidate, _ = self._idle.pop()
+                if candidate.is_connected:
+                    smtp = candidate
+                    break
+            if smtp is None:
+                smtp = await self._connect()
+            healthy = True
+            try:
+                yield smtp
+            except RECONNECT_ERRORS:
+                healthy = False
+                raise
+            finally:
+                if healthy and smtp.is_connected:
+                    self._idle.append((smtp, time.monotonic()))
+                else:
+                    smtp.close()
+
+    async def sendmail(self, sender: str, recipient: str, message: str) -> None:
+        started_at = time.perf_counter()
+        result = "error"
+        try:
+            try:
+                async with self.acquire() as smtp:
+                    await smtp.sendmail(sender, recipient, message)
+            except RECONNECT_ERRORS:
+                async with self.acquire() as smtp:
+                    await smtp.sendmail(sender, recipient, message)
+            result = "ok"
+        finally:
+            smtp_send_seconds.labels(result=result).observe(time.perf_counter() - started_at)
@@ -0,0 +1,78 @@
+import json
+import hashlib
+import time
+from typing import Optional
+from models.user import User, UserRole
+from schemas.token import TokenPayload
+from service.redis_service import LocalCache, redis_pool
+from settings import settings
+
+
+local_users = LocalCache(settings.user_cache_max_bytes, settings.user_cache_ttl)
+redis_pool.register_local_cache(local_users)
+token_memo = LocalCache(settings.jwt_memo_max_bytes, settings.jwt_memo_max_ttl)
+
+
+def user_key(username: str) -> str:
+    return f"user:{username}"
+
+
+def role_key(role_id: int) -> str:
+    return f"role:{role_id}"
+
+
+async def _get(key: str) -> Optional[dict]:
+    value = local_users.get(key)
+    if value is None:
+        value = await redis_pool.get_cache(key)
+        if value is None:
+            return None
+        local_users.set(key, value, settings.user_cache_ttl)
+    return json.loads(value)
+
+
+async def _set(key: str, data: dict) -> None:
+    value = json.dumps(data).encode()
+    local_users.set(key, value, settings.user_cache_ttl)
+    await redis_pool.set_cache(key, value, expire=settings.user_cache_ttl)
+
+
+async def get_cached_user(username: str) -> Optional[User]:
+    """
+    Returns a detached User with its role from the in-process or Redis cache,
+    or None if either part is not cached. Password hashes are never cached.
+    """
+    data = await _get(user_key(username))
+    if data is None:
+        return None
+    role = await _get(role_key(data["role_id"]))
+    if role is None:
+        return None
+    user = User(id=data["id"], username=data["username"], email=data["email"], role_id=data["role_id"])
+    user.role = UserRole(**role)
+    return user
+
+
+async def cache_user(user: User) -> None:
+    await _set(user_key(user.username), {"id": user.id, "username": user.username,
+                                          "email": user.email, "role_id": user.role_id})
+    role = user.role
+    await _set(role_key(role.id), {"id": role.id, "name": role.name, "is_admin": role.is_admin})
+
+
+async def invalidate_user(username: str) -> None:
+    await redis_pool.delete_cache(user_key(username))
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_memoized_token(token: str) -> Optional[TokenPayload]:
+    value = token_memo.get(_token_key(token))
+    return TokenPayload.model_validate_json(value) if value is not None else None
+
+
+def memoize_token(token: str, payload: TokenPayload) -> None:
+    """Remembers a verified token until it expires."""
+    token_memo.set(_token_key(token), payload.model_dump_json().encode(), payload.exp - time.time())
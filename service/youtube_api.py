@@ -0,0 +1,119 @@
+import re
+import time
+import asyncio
+from typing import Dict, List, Optional, Set
+from logger import get_logger
+from settings import settings
+from metrics import youtube_api_batch_size, youtube_api_seconds
+
+logger = get_logger('api_logger.log')
+
+DEFAULT_API_URL = "https://www.googleapis.com/youtube/v3/videos"
+MAX_IDS_PER_CALL = 50
+DURATION_PATTERN = re.compile(r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def parse_duration(value: str) -> Optional[int]:
+    """Seconds in an ISO 8601 duration such as PT1H2M3S, as returned by the Data API."""
+    match = DURATION_PATTERN.match(value or "")
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part) if part else 0 for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+class YoutubeMetadataBatcher:
+    """
+    Title and duration from the YouTube Data API `videos.list`, without a
+    player extraction. Ids requested within `window_ms` are sent together,
+    up to 50 per call, over one shared aiohttp session.
+    """
+
+    def __init__(self, api_url: str, api_key: str, window_ms: float, batch_size: int = MAX_IDS_PER_CALL) -> None:
+        self.api_url = api_url or DEFAULT_API_URL
+        self.api_key = api_key
+        self.window = window_ms / 1000
+        self.batch_size = min(batch_size, MAX_IDS_PER_CALL)
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self._session = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=settings.proxy_read_timeout))
+        return self._session
+
+    async def close(self) -> None:
+        await asyncio.gather(*filter(None, [self._flush_task, *self._flushes]))
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get(self, video_id: str) -> Optional[Dict]:
+        """Returns {"title", "duration"} of the video, or None if the API does not know it."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(video_id, []).append(future)
+        if len(self._pending) >= self.batch_size:
+            # in its own task, so cancelling this caller leaves the other waiters served
+            task = asyncio.create_task(self._flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        while self._pending:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        ids = list(self._pending)[:self.batch_size]
+        waiters = {video_id: self._pending.pop(video_id) for video_id in ids}
+        if not ids:
+            return
+        youtube_api_batch_size.observe(len(ids))
+        started_at = time.perf_counter()
+        try:
+            # the key goes in a header so it never shows up in a logged url
+            params = {"part": "snippet,contentDetails", "id": ",".join(ids), "maxResults": str(MAX_IDS_PER_CALL)}
+            headers = {"X-goog-api-key": self.api_key}
+            async with self.session().get(self.api_url, params=params, headers=headers) as response:
+                response.raise_for_status()
+                items = (await response.json()).get("items", [])
+            found = {
+                item["id"]: {
+                    "title": item.get("snippet", {}).get("title"),
+                    "duration": parse_duration(item.get("contentDetails", {}).get("duration")),
+                }
+                for item in items
+            }
+        except Exception as e:
+            logger.error(f"Have error in videos.list, reason <{str(e)}>")
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        finally:
+            youtube_api_seconds.observe(time.perf_counter() - started_at)
+        for video_id, futures in waiters.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(found.get(video_id))
+
+
+youtube_metadata = YoutubeMetadataBatcher(
+    api_url=settings.youtube_api_url,
+    api_key=settings.youtube_api_key,
+    window_ms=settings.youtube_api_batch_window_ms,
+    batch_size=settings.youtube_api_batch_size,
+)
@@ -1,19 +1,16 @@
-import aiohttp.client_exceptions
 from fastapi import HTTPException
-import aiohttp
 from typing import Optional, Annotated, Dict, Any
-from pytubefix import Stream
-from pytubefix import YouTube, exceptions
-from pytubefix.cli import on_progress
 import re
 from enum import Enum
-import asyncio
 from logger import get_logger
 from settings import settings
-from utils import BaseService
+from utils import BaseService, VideoUnavailable, compile_pattern
+from schemas.manifest import VideoManifest, StreamInfo
 
 logger = get_logger('api_logger.log')
 
+VIDEO_ID_PATTERN = r"^[A-Za-z0-9_-]{11}$"
+
 
 class VideoFormat(Enum):
     MP4 = "mp4"
@@ -22,30 +19,46 @@ class VideoFormat(Enum):
 
 
 class YoutubeService(BaseService):
-    def get_stream(self) -> dict[str, Any]:
+    name = "youtube"
+    formats = tuple(format.value for format in VideoFormat)
+    id_pattern = compile_pattern(settings.youtube_video_id_pattern or VIDEO_ID_PATTERN)
+
+    def get_manifest(self) -> VideoManifest:
+        # pytubefix is imported on first extraction to keep it off the startup path
+        from pytubefix import YouTube, exceptions
+        from pytubefix.cli import on_progress
         try:
             link = f"https://www.youtube.com/watch?v={self.content_id}"
-            if self.fmt and self.fmt not in (format.value for format in VideoFormat):
-                raise HTTPException(status_code=400, detail=f"Unsupported format: {self.fmt}")
-
-            res = YouTube(link, on_progress_callback=on_progress).streams.filter(subtype=self.fmt) \
-                .order_by("resolution").desc().first()
-
-            return {
-                "duration": res._monostate.duration,
-                "filesize_mb": res._filesize_mb,
-                "title": res._monostate.title,
-                "url": res.url,
-                "resolution": res.resolution
-            }
-
+            yt = YouTube(link, on_progress_callback=on_progress)
+            streams = [
+                StreamInfo(
+                    itag=stream.itag,
+                    mime_type=stream.mime_type,
+                    subtype=stream.subtype,
+                    resolution=stream.resolution,
+                    abr=stream.abr,
+                    filesize=stream._filesize,
+                    filesize_mb=stream._filesize_mb,
+                    is_progressive=stream.is_progressive,
+                    url=stream.url,
+                )
+                for stream in yt.streams
+            ]
+            return VideoManifest(source=self.name, video_id=self.content_id,
+                                 title=yt.title, duration=yt.length, streams=streams)
 
-        except exceptions.VideoUnavailable:
-            raise HTTPException(status_code=404, detail="Video not found")
+        except (exceptions.VideoPrivate, exceptions.VideoRemovedByUploader,
+                exceptions.VideoRemovedByYouTubeForViolatingTOS, exceptions.AccountTerminated,
+                exceptions.MembersOnly):
+            raise VideoUnavailable(status_code=404, detail="Video not found")
         except HTTPException:
             raise
         except Exception as e:
-            logger.error(f'Have error in get_stream(), reason <{str(e)}>')
+            if type(e) is exceptions.VideoUnavailable:
+                raise VideoUnavailable(status_code=404, detail="Video not found")
+            # other VideoUnavailable subclasses (bot checks, login walls, offline
+            # streams...) may pass on a retry, so they are not cached
+            logger.error(f'Have error in get_manifest(), reason <{str(e)}>')
             ansi_escape = re.compile(r'(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]')
             message = ansi_escape.sub('', str(e))
             raise HTTPException(status_code=400, detail=message)
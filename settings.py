@@ -4,8 +4,12 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class AppSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
     youtube_video_id_pattern: str = ""
+    instagram_shortcode_pattern: str = ""
     youtube_api_key: str = ""
     youtube_api_url: str = ""
+    youtube_api_batch_window_ms: float = 10
+    youtube_api_batch_size: int = 50
+    youtube_api_cache_ttl: int = 6 * 3600
     redis_url: str = "localhost"
     jwt_secret_key: str = ""
     jwt_refresh_key: str = ""
@@ -19,8 +23,93 @@ class AppSettings(BaseSettings):
     celery_broker_url: str = "localhost"
     celery_result_backend: str = "localhost"
     database_url: str = "localhost"
+    database_echo: bool = False
+    create_schema_on_startup: bool = False
+    database_pool_size: int = 10
+    database_max_overflow: int = 20
+    database_pool_pre_ping: bool = True
+    database_pool_recycle: int = 1800
+    database_statement_cache_size: int = 500
     rabbitmq_url: str = "localhost"
     instagram_user: str = ""
     instagram_password: str = ""
+    rabbitmq_channel_pool_size: int = 4
+    rabbitmq_batch_window_ms: float = 0
+    rabbitmq_batch_max_size: int = 100
+    rabbitmq_connect_timeout: float = 5.0
+    worker_prefetch_count: int = 20
+    worker_concurrency: int = 10
+    smtp_pool_size: int = 4
+    smtp_idle_timeout: float = 60
+    worker_metrics_port: int = 9101
+    celery_metrics_port: int = 9102
+    email_max_retries: int = 3
+    email_retry_base_delay_ms: int = 1000
+    email_retry_max_delay_ms: int = 300000
+    email_retry_depth_interval: float = 15
+    celery_email_batch_size: int = 20
+    celery_email_batch_window_ms: float = 50
+    l1_cache_enabled: bool = False
+    l1_cache_max_bytes: int = 16 * 1024 * 1024
+    l1_cache_max_ttl: float = 30
+    cache_default_ttl: int = 120
+    cache_max_ttl: int = 6 * 3600
+    cache_expiry_margin: int = 600
+    cache_stale_while_revalidate: bool = True
+    cache_refresh_ahead: int = 300
+    cache_refresh_ahead_ratio: float = 0.2
+    batch_max_items: int = 200
+    batch_max_concurrency: int = 8
+    user_cache_ttl: int = 60
+    user_cache_max_bytes: int = 4 * 1024 * 1024
+    jwt_memo_max_ttl: float = 30 * 60
+    jwt_memo_max_bytes: int = 4 * 1024 * 1024
+    bcrypt_rounds: int = 12
+    password_workers: int = 2
+    password_max_queue: int = 64
+    log_body_sample_rate: float = 0.0
+    log_body_max_bytes: int = 2048
+    extraction_max_workers: int = 16
+    youtube_max_concurrency: int = 12
+    instagram_max_concurrency: int = 4
+    instagram_pool_size: int = 4
+    instagram_session_dir: str = ".instaloader_sessions"
+    instagram_session_check_interval: float = 1800
+    extraction_lock_ttl: int = 30
+    extraction_lock_wait: float = 20.0
+    extraction_lock_poll_interval: float = 0.1
+    extraction_shed_queue_depth: int = 64
+    extraction_shed_retry_after: int = 5
+    negative_cache_ttl: int = 300
+    rate_limit_enabled: bool = True
+    rate_limit_user_capacity: int = 20
+    rate_limit_user_refill_per_second: float = 0.2
+    rate_limit_source_capacity: int = 200
+    rate_limit_source_refill_per_second: float = 5.0
+    job_ttl: int = 3600
+    job_workers: int = 8
+    job_worker_concurrency: int = 16
+    job_worker_metrics_port: int = 9103
+    job_max_queue: int = 1000
+    job_poll_timeout: float = 1.0
+    job_heartbeat_ttl: int = 30
+    job_events_keepalive: float = 15.0
+    job_events_timeout: float = 120.0
+    proxy_chunk_size: int = 64 * 1024
+    proxy_max_concurrency: int = 64
+    proxy_pool_size: int = 100
+    proxy_connect_timeout: float = 10.0
+    proxy_read_timeout: float = 30.0
+    media_cache_enabled: bool = True
+    media_cache_dir: str = ".media_cache"
+    media_cache_max_bytes: int = 10 * 1024 ** 3
+    media_cache_max_file_bytes: int = 1024 ** 3
+    media_cache_fill_concurrency: int = 4
+    downloader_max_connections: int = 16
+    downloader_connections_per_job: int = 4
+    downloader_part_size: int = 8 * 1024 * 1024
+    downloader_bandwidth: int = 0
+    downloader_retries: int = 3
+    downloader_retry_backoff: float = 0.5
 
 settings = AppSettings()
\ No newline at end of file
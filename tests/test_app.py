@@ -1,6 +1,13 @@
+import asyncio
+import fakeredis
 from auth import get_current_user
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from main import app
+from main import app, manifest_key, Source, run_job
+from service.manifest_service import revalidations
+from service.job_service import job_service
+from service.youtube_api import youtube_metadata
+from schemas.manifest import VideoManifest, StreamInfo
 from service.redis_service import get_redis_service
 import pytest
 from starlette.requests import Request
@@ -10,12 +17,45 @@ VIDEO_ID = "7t2alSnE2-I"
 FMT = "mp4"
 
 
+def make_manifest(url="http://fakeurl.com/video.mp4"):
+    return VideoManifest(source="youtube", video_id=VIDEO_ID, title="Video", duration=6379, streams=[
+        StreamInfo(mime_type="video/webm", subtype="webm", resolution="1080p", url="http://fakeurl.com/video.webm"),
+        StreamInfo(mime_type="video/mp4", subtype="mp4", resolution="360p", url="http://fakeurl.com/low.mp4"),
+        StreamInfo(mime_type="video/mp4", subtype="mp4", resolution="720p", url=url),
+        StreamInfo(mime_type="audio/mp4", subtype="mp4", abr="128kbps", url="http://fakeurl.com/audio.m4a"),
+    ])
+
+
+def cached_manifest(url="http://fakeurl.com/video.mp4"):
+    return make_manifest(url).model_dump_json().encode()
+
+
 @pytest.fixture
 def client():
     with TestClient(app) as c:
         yield c
 
 
+@pytest.fixture(autouse=True)
+def jobs():
+    with patch.object(job_service, "_redis", fakeredis.FakeAsyncRedis()):
+        yield job_service
+
+
+def run_next_job(client, redis):
+    """Does the work of one job worker: runs the next queued job against `redis`."""
+    async def run():
+        job = await job_service.next_job(timeout=1)
+        return await job_service.process(job, lambda job: run_job(job, redis))
+    return client.portal.call(run)
+
+
+def job_of(client, response, email="test@example.com"):
+    assert response.status_code == 202
+    with patch.object(Request, "session", {"user": {"email": email}}):
+        return client.get(f"/jobs/{response.json()['job_id']}").json()
+
+
 @pytest.fixture
 def mock_redis_service():
     with patch("service.redis_service.RedisService", new_callable=AsyncMock) as mock:
@@ -24,6 +64,8 @@ def mock_redis_service():
 
 @pytest.fixture
 def set_dependencies(mock_redis_service):
+    mock_redis_service.take_tokens = AsyncMock(return_value=0)
+    mock_redis_service.get_cache = AsyncMock(return_value=None)
     app.dependency_overrides[get_redis_service] = lambda: mock_redis_service
     yield
     app.dependency_overrides.pop(get_redis_service, None)
@@ -31,7 +73,7 @@ def set_dependencies(mock_redis_service):
 
 @pytest.fixture
 def mock_publish_message():
-    with patch('main.publish_message', new_callable=AsyncMock) as publish:
+    with patch('service.manifest_service.publish_message', new_callable=AsyncMock) as publish:
         yield publish
 
 
@@ -43,7 +85,7 @@ def mock_source():
 
 @pytest.fixture
 def mock_fetch_video():
-    with patch("utils.BaseService.fetch_video_info", new_callable=AsyncMock) as mock:
+    with patch("utils.BaseService.fetch_manifest", new_callable=AsyncMock) as mock:
         yield mock
 
 
@@ -69,22 +111,30 @@ async def test_get_metadata_user_not_authenticated(client, mock_redis_service):
 @pytest.mark.asyncio
 async def test_get_link_user_authenticated(client, set_dependencies, mock_publish_message, mock_redis_service):
     with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
-        mock_redis_service.get_cache = AsyncMock(return_value=b"http://example.com/7t2alSnE2-I")
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest("http://example.com/7t2alSnE2-I"), 3600))
         response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
-        assert response.status_code == 200
-        assert response.json() == {"detail": "Link for download video was sent by email."}
+        job = job_of(client, response)
+        assert job["status"] == "done"
+        assert job["result"]["url"] == "http://example.com/7t2alSnE2-I"
+        assert "email" not in job
 
 
 @pytest.mark.asyncio
 async def test_get_link_empty_cache(client, set_dependencies, mock_publish_message, mock_redis_service,
                                     mock_fetch_video):
     with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
-        mock_redis_service.get_cache = AsyncMock(return_value=None)
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
         mock_redis_service.set_cache = AsyncMock()
-        mock_fetch_video.return_value = {"url": "http://fakeurl.com/video.mp4"}
+        mock_fetch_video.return_value = make_manifest("http://fakeurl.com/video.mp4")
+        mock_redis_service.get_cache = AsyncMock(return_value=None)
         response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
-        assert response.status_code == 200
-        assert response.json() == {"detail": "Link for download video was sent by email."}
+        assert job_of(client, response)["status"] == "queued"
+        mock_fetch_video.assert_not_called()
+
+        run_next_job(client, mock_redis_service)
+        job = job_of(client, response)
+        assert job["status"] == "done"
+        assert job["result"]["url"] == "http://fakeurl.com/video.mp4"
         mock_fetch_video.assert_called_once()
         mock_publish_message.assert_called_once_with("http://fakeurl.com/video.mp4", "test@example.com")
 
@@ -93,21 +143,136 @@ async def test_get_link_empty_cache(client, set_dependencies, mock_publish_messa
 async def test_get_link_with_cache(client, set_dependencies, mock_publish_message, mock_redis_service,
                                    mock_fetch_video):
     with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
-        mock_redis_service.get_cache = AsyncMock(return_value=b"http://fakeurl.com/video.mp4")
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest("http://fakeurl.com/video.mp4"), 3600))
         response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
-        assert response.status_code == 200
-        assert response.json() == {"detail": "Link for download video was sent by email."}
+        assert response.status_code == 202
+        assert response.json()["status_url"].endswith(f"/jobs/{response.json()['job_id']}")
         assert mock_fetch_video.call_count == 0
         mock_publish_message.assert_called_once_with("http://fakeurl.com/video.mp4", "test@example.com")
 
 
+def test_rate_limited_miss_is_refused_before_extraction(client, set_dependencies, mock_publish_message,
+                                                        mock_redis_service, mock_fetch_video):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
+        mock_redis_service.take_tokens = AsyncMock(return_value=2.5)
+        response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    buckets = mock_redis_service.take_tokens.call_args.args[0]
+    assert [key for key, _, _ in buckets] == ["ratelimit:youtube:test@example.com", "ratelimit:youtube"]
+    mock_fetch_video.assert_not_called()
+
+
+def test_token_users_share_the_email_bucket(client, set_dependencies, mock_user, mock_redis_service,
+                                            mock_fetch_video):
+    mock_user.email, mock_user.username = "test@example.com", "test"
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
+    mock_redis_service.take_tokens = AsyncMock(return_value=2.5)
+    response = client.get(f"/get-metadata/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    app.dependency_overrides.pop(get_current_user, None)
+    assert response.status_code == 429
+    buckets = mock_redis_service.take_tokens.call_args.args[0]
+    assert buckets[0][0] == "ratelimit:youtube:test@example.com"
+
+
+def test_misses_are_shed_when_the_extraction_queue_is_full(client, set_dependencies, mock_publish_message,
+                                                           mock_redis_service, mock_fetch_video):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}), \
+            patch("main.extraction_executor.queue_depth", return_value=1000):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
+        miss = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(), 3600))
+        hit = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    assert miss.status_code == 503
+    assert miss.headers["Retry-After"] == "5"
+    assert hit.status_code == 202
+    mock_fetch_video.assert_not_called()
+
+
+def test_invalid_video_id_is_rejected_before_the_cache(client, set_dependencies, mock_publish_message,
+                                                       mock_redis_service, mock_fetch_video):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
+        response = client.get(f"/get-download-link/?source=youtube&video_id=bad!id&fmt={FMT}")
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Invalid video ID: bad!id"}
+    mock_redis_service.get_cache_with_ttl.assert_not_called()
+    mock_redis_service.get_cache.assert_not_called()
+    mock_fetch_video.assert_not_called()
+
+
+def test_unavailable_video_is_cached_and_short_circuits_retries(client, set_dependencies, mock_publish_message,
+                                                               mock_redis_service, mock_fetch_video):
+    from prometheus_client import REGISTRY
+    from utils import VideoUnavailable
+    negative = {}
+
+    async def set_cache(key, value, expire):
+        negative[key] = (value, expire)
+
+    async def get_cache(key):
+        return negative.get(key, (None,))[0]
+
+    mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
+    mock_redis_service.get_cache = AsyncMock(side_effect=get_cache)
+    mock_redis_service.set_cache = AsyncMock(side_effect=set_cache)
+    mock_fetch_video.side_effect = VideoUnavailable(status_code=404, detail="Video not found")
+    before = REGISTRY.get_sample_value("negative_cache_hits_total", {"source": "youtube"}) or 0
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        first = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+        assert run_next_job(client, mock_redis_service).status_code == 404
+        assert negative[f"unavailable:youtube:{VIDEO_ID}"][1] == 300
+        retry = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    assert first.status_code == 202
+    assert retry.status_code == 404
+    assert retry.json() == {"detail": "Video not found"}
+    assert mock_fetch_video.call_count == 1
+    assert mock_redis_service.take_tokens.call_count == 1
+    assert REGISTRY.get_sample_value("negative_cache_hits_total", {"source": "youtube"}) == before + 1
+
+
+def test_bot_detection_is_not_cached(client, set_dependencies, mock_publish_message, mock_redis_service):
+    from pytubefix.exceptions import BotDetection
+    mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
+    mock_redis_service.set_cache = AsyncMock()
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}), \
+            patch("pytubefix.YouTube", side_effect=BotDetection(VIDEO_ID)) as youtube:
+        for _ in range(2):
+            response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+            assert response.status_code == 202
+            assert run_next_job(client, mock_redis_service).status_code == 400
+    assert youtube.call_count == 2
+    mock_redis_service.set_cache.assert_not_called()
+
+
+def test_cache_lookups_are_counted_per_endpoint(client, set_dependencies, mock_publish_message,
+                                                mock_redis_service):
+    from prometheus_client import REGISTRY
+
+    def hits():
+        return REGISTRY.get_sample_value("manifest_cache_lookups_total",
+                                         {"endpoint": "download_link", "result": "hit"}) or 0
+
+    before = hits()
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(), 3600))
+        client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    assert hits() == before + 1
+
+
 @pytest.mark.asyncio
 async def test_get_link_instagram(client, set_dependencies, mock_publish_message, mock_redis_service):
     with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
-        mock_redis_service.get_cache = AsyncMock(return_value=None)
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
         mock_redis_service.set_cache = AsyncMock()
+        mock_redis_service.get_cache = AsyncMock(return_value=None)
         response = client.get(f"/get-download-link/?source=instagram&video_id=7t2alSnE2-H&fmt={FMT}")
-        assert response.status_code == 422
+        run_next_job(client, mock_redis_service)
+        job = job_of(client, response)
+        assert job["status"] == "failed"
+        assert job["status_code"] == 422
 
 
 @pytest.mark.asyncio
@@ -132,13 +297,241 @@ def test_user_login(client: TestClient):
 
 @pytest.mark.asyncio
 async def test_get_metadata_authenticated(client, set_dependencies, mock_user, mock_celery, mock_redis_service):
-    mock_user.return_value = {"admin": {"email": "test@example.com"}}
+    mock_user.email, mock_user.username = "test@example.com", "test"
     app.dependency_overrides[get_current_user] = lambda: mock_user
-    return_val = b'{"duration": 6379, "url": "http://fakeurl.com/video.mp4"}'
-    mock_redis_service.get_cache = AsyncMock(return_value=return_val)
+    mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(), 3600))
     response = client.get(f"/get-metadata/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    assert job_of(client, response)["result"]["title"] == "Video"
+    mock_celery.assert_called_once()
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_metadata_miss_uses_the_data_api(client, set_dependencies, mock_user, mock_celery, mock_redis_service,
+                                          mock_fetch_video):
+    mock_user.email, mock_user.username = "test@example.com", "test"
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
+    mock_redis_service.get_cache = AsyncMock(return_value=None)
+    mock_redis_service.set_cache = AsyncMock()
+    lookup = AsyncMock(return_value={"title": "From API", "duration": 65})
+    with patch.object(youtube_metadata, "api_key", "key"), patch.object(youtube_metadata, "get", lookup):
+        response = client.get(f"/get-metadata/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    job = job_of(client, response)
+    assert job["status"] == "done"
+    assert job["result"] == {"title": "From API", "duration": 65}
+    mock_fetch_video.assert_not_called()
+    mock_celery.assert_called_once()
+    assert mock_redis_service.set_cache.call_args.kwargs["key"] == f"metadata:youtube:{VIDEO_ID}"
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_metadata_falls_back_to_a_job_when_the_data_api_fails(client, set_dependencies, mock_user, mock_celery,
+                                                             mock_redis_service):
+    mock_user.email, mock_user.username = "test@example.com", "test"
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(None, None))
+    mock_redis_service.get_cache = AsyncMock(return_value=None)
+    lookup = AsyncMock(side_effect=asyncio.TimeoutError())
+    with patch.object(youtube_metadata, "api_key", "key"), patch.object(youtube_metadata, "get", lookup):
+        response = client.get(f"/get-metadata/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    assert job_of(client, response)["status"] == "queued"
+    mock_celery.assert_not_called()
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+@pytest.mark.asyncio
+async def test_every_format_is_served_from_one_cached_manifest(client, set_dependencies, mock_publish_message,
+                                                               mock_redis_service, mock_fetch_video):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(), 3600))
+        for fmt in ("mp4", "webm"):
+            response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={fmt}")
+            assert response.status_code == 202
+        assert mock_fetch_video.call_count == 0
+        assert [call.args[0] for call in mock_publish_message.call_args_list] == [
+            "http://fakeurl.com/video.mp4", "http://fakeurl.com/video.webm"]
+        mock_redis_service.get_cache_with_ttl.assert_called_with(key=manifest_key(Source.youtube, VIDEO_ID))
+
+
+@pytest.mark.asyncio
+async def test_missing_format_is_not_found(client, set_dependencies, mock_publish_message, mock_redis_service):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(), 3600))
+        response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt=mkv")
+        assert response.status_code == 404
+        mock_publish_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_link_near_expiry_is_served_and_revalidated(client, set_dependencies, mock_publish_message,
+                                                               mock_redis_service, mock_fetch_video):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest("http://fakeurl.com/old.mp4"), 10))
+        mock_redis_service.set_cache = AsyncMock()
+        mock_fetch_video.return_value = make_manifest("http://fakeurl.com/new.mp4")
+        response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+        assert response.status_code == 202
+        mock_publish_message.assert_called_once_with("http://fakeurl.com/old.mp4", "test@example.com")
+    while revalidations:
+        await asyncio.sleep(0.01)
+    mock_fetch_video.assert_called_once()
+    mock_redis_service.set_cache.assert_any_call(key=manifest_key(Source.youtube, VIDEO_ID),
+                                                 value=make_manifest("http://fakeurl.com/new.mp4").model_dump_json(),
+                                                 expire=120)
+
+
+@pytest.mark.asyncio
+async def test_default_ttl_hit_is_not_revalidated(client, set_dependencies, mock_publish_message,
+                                                  mock_redis_service, mock_fetch_video):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(), 100))
+        for _ in range(5):
+            response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+            assert response.status_code == 202
+    assert not revalidations
+    mock_fetch_video.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_batch_reports_each_item(client, set_dependencies, mock_user, mock_celery, mock_redis_service,
+                                       mock_fetch_video):
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    mock_redis_service.get_many = AsyncMock(return_value=[cached_manifest(), None, None])
+    mock_redis_service.set_cache = AsyncMock()
+    mock_fetch_video.side_effect = [make_manifest("http://fakeurl.com/second.mp4"),
+                                    HTTPException(status_code=404, detail="Video not found")]
+    items = [
+        {"source": "youtube", "video_id": VIDEO_ID, "fmt": "mp4"},
+        {"source": "youtube", "video_id": VIDEO_ID, "fmt": "webm"},
+        {"source": "youtube", "video_id": "second-vid1", "fmt": "mp4"},
+        {"source": "youtube", "video_id": "missing-vid", "fmt": "mp4"},
+        {"source": "youtube", "video_id": VIDEO_ID, "fmt": "avi"},
+    ]
+    response = client.post("/batch/", json={"items": items, "delivery": "response"})
+    app.dependency_overrides.pop(get_current_user, None)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status_code"] for result in results] == [200, 200, 200, 404, 400]
+    assert [result["url"] for result in results[:3]] == [
+        "http://fakeurl.com/video.mp4", "http://fakeurl.com/video.webm", "http://fakeurl.com/second.mp4"]
+    assert mock_fetch_video.call_count == 2
+    mock_redis_service.get_many.assert_called_once()
+    mock_celery.assert_not_called()
+
+
+def test_batch_item_with_only_an_unsupported_format_is_a_400(client, set_dependencies, mock_user,
+                                                             mock_redis_service, mock_fetch_video):
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    mock_redis_service.get_many = AsyncMock(return_value=[])
+    items = [{"source": "youtube", "video_id": VIDEO_ID, "fmt": "avi"}]
+    response = client.post("/batch/", json={"items": items, "delivery": "response"})
+    app.dependency_overrides.pop(get_current_user, None)
+    assert [result["status_code"] for result in response.json()["results"]] == [400]
+    mock_fetch_video.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_batch_sends_one_email(client, set_dependencies, mock_user, mock_celery, mock_redis_service):
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    mock_redis_service.get_many = AsyncMock(return_value=[cached_manifest()])
+    items = [{"source": "youtube", "video_id": VIDEO_ID, "fmt": fmt} for fmt in ("mp4", "webm")]
+    response = client.post("/batch/", json={"items": items})
+    app.dependency_overrides.pop(get_current_user, None)
+
     assert response.status_code == 200
-    assert response.json() == {"detail": "Video metadata was sent by email."}
+    assert response.json()["detail"] == "Batch results were sent by email."
     mock_celery.assert_called_once()
 
 
+def test_sampled_bodies_keep_response_intact(client):
+    with patch("main.settings.log_body_sample_rate", 1.0), patch("main.logger.info") as log:
+        response = client.get("/")
+    assert response.status_code == 200
+    assert response.json() == {"detail": "Not authenticated"}
+    fields = log.call_args.kwargs["extra"]["fields"]
+    assert fields["response_body"] == '{"detail":"Not authenticated"}'
+    assert fields["status"] == 200
+
+
+def test_startup_report_and_roles_seeded_once(client):
+    report = app.state.startup_report
+    assert {"import_ms", "init_roles_ms", "startup_ms"} <= report.keys()
+
+    async def count_roles():
+        from sqlalchemy import func, select
+        from database import AsyncSessionLocal
+        from models.user import UserRole
+        from utils import init_roles
+        await init_roles()
+        async with AsyncSessionLocal() as session:
+            return await session.scalar(select(func.count()).select_from(UserRole))
+
+    assert client.portal.call(count_roles) == 3
+
+
+def test_job_events_stream_the_finished_job(client, set_dependencies, mock_publish_message, mock_redis_service):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(), 3600))
+        response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+        with client.stream("GET", response.json()["events_url"]) as events:
+            assert events.headers["content-type"].startswith("text/event-stream")
+            body = "".join(events.iter_text())
+        assert client.get("/jobs/unknown").status_code == 404
+    assert body.startswith("event: done\ndata: ")
+
+
+def test_jobs_are_only_visible_to_their_owner(client, set_dependencies, mock_publish_message, mock_redis_service):
+    with patch.object(Request, "session", {"user": {"email": "test@example.com"}}):
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(), 3600))
+        response = client.get(f"/get-download-link/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}")
+    job_id = response.json()["job_id"]
+    assert client.get(f"/jobs/{job_id}").status_code == 401
+    assert client.get(f"/jobs/{job_id}/events").status_code == 401
+    with patch.object(Request, "session", {"user": {"email": "other@example.com"}}):
+        assert client.get(f"/jobs/{job_id}").status_code == 404
+        assert client.get(f"/jobs/{job_id}/events").status_code == 404
+    assert job_of(client, response)["status"] == "done"
+
+
+def test_download_streams_the_selected_stream_with_range(client, set_dependencies, mock_user, mock_redis_service):
+    from tests.test_proxy_service import MEDIA, start_upstream
+    upstream = client.portal.call(start_upstream)
+    try:
+        mock_user.username = "test"
+        app.dependency_overrides[get_current_user] = lambda: mock_user
+        url = str(upstream.make_url("/video.mp4"))
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(cached_manifest(url), 3600))
+        response = client.get(f"/download/?source=youtube&video_id={VIDEO_ID}&fmt={FMT}",
+                              headers={"Range": "bytes=10-19"})
+        app.dependency_overrides.pop(get_current_user, None)
+    finally:
+        client.portal.call(upstream.close)
+    assert response.status_code == 206
+    assert response.content == MEDIA[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(MEDIA)}"
+
+
+def test_second_download_is_served_from_the_media_cache(client, set_dependencies, mock_user, mock_redis_service):
+    from tests.test_proxy_service import MEDIA, start_upstream
+    from service.media_cache import media_cache
+    upstream = client.portal.call(start_upstream)
+    mock_user.username = "test"
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    url = f"/download/?source=youtube&video_id=cachedvideo&fmt={FMT}"
+    try:
+        manifest = make_manifest(str(upstream.make_url("/video.mp4"))).model_dump_json().encode()
+        mock_redis_service.get_cache_with_ttl = AsyncMock(return_value=(manifest, 3600))
+        assert client.get(url).content == MEDIA
+
+        async def wait_for_fills():
+            await asyncio.gather(*media_cache._fills.values())
+        client.portal.call(wait_for_fills)
+    finally:
+        client.portal.call(upstream.close)
+
+    response = client.get(url, headers={"Range": "bytes=100-199"})
+    app.dependency_overrides.pop(get_current_user, None)
+    assert response.status_code == 206
+    assert response.content == MEDIA[100:200]
+    assert mock_redis_service.get_cache_with_ttl.call_count == 1
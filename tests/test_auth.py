@@ -0,0 +1,50 @@
+import pytest
+import fakeredis
+from unittest.mock import AsyncMock, patch
+import auth
+from auth import create_access_token, get_current_user
+from models.user import User, UserRole
+from service import user_cache
+from service.redis_service import redis_pool
+
+
+@pytest.fixture
+def fake_redis():
+    original = redis_pool._redis
+    redis_pool._redis = fakeredis.aioredis.FakeRedis()
+    user_cache.local_users.clear()
+    user_cache.token_memo.clear()
+    yield redis_pool._redis
+    redis_pool._redis = original
+
+
+def make_user():
+    user = User(id=1, username="test_user", email="test@example.com", password_hash="hash", role_id=2)
+    user.role = UserRole(id=2, name="user", is_admin=False)
+    return user
+
+
+@pytest.mark.asyncio
+async def test_steady_state_requests_skip_the_database(fake_redis):
+    token = create_access_token(data={"name": "test_user", "role": "user"})
+    with patch("auth.get_user", new_callable=AsyncMock, return_value=make_user()) as get_user, \
+            patch("auth.jwt.decode", wraps=auth.jwt.decode) as decode:
+        first = await get_current_user(token, db=None)
+        second = await get_current_user(token, db=None)
+
+    assert get_user.await_count == 1
+    assert decode.call_count == 1
+    assert (second.username, second.email, second.role.name) == ("test_user", "test@example.com", "user")
+    assert first.role.is_admin is False
+
+
+@pytest.mark.asyncio
+async def test_user_cache_is_shared_through_redis_and_invalidated(fake_redis):
+    await user_cache.cache_user(make_user())
+    user_cache.local_users.clear()
+    cached = await user_cache.get_cached_user("test_user")
+    assert cached.email == "test@example.com"
+    assert cached.password_hash is None
+
+    await user_cache.invalidate_user("test_user")
+    assert await user_cache.get_cached_user("test_user") is None
@@ -0,0 +1,21 @@
+from benchmarks.run import compare, summarize
+
+
+def test_summarize_reports_percentiles_and_throughput():
+    result = summarize([i / 1000 for i in range(1, 101)], errors=2, duration=2.0)
+    assert result["requests"] == 100
+    assert result["errors"] == 2
+    assert result["throughput_rps"] == 50.0
+    assert result["latency_ms"]["p50"] == 50.5
+    assert result["latency_ms"]["p99"] == 99.01
+    assert result["latency_ms"]["max"] == 100.0
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    def run(p95, rps):
+        return {"scenarios": {"token": {"latency_ms": {"p95": p95}, "throughput_rps": rps}}}
+
+    assert compare(run(105, 95), run(100, 100), tolerance=10) == []
+    regressions = compare(run(150, 50), run(100, 100), tolerance=10)
+    assert len(regressions) == 2
+    assert compare({"scenarios": {"other": run(1, 1)["scenarios"]["token"]}}, run(100, 100), 10) == []
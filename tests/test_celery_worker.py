@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+from celery_worker import EmailBatcher, EmailSender
+
+
+class FakeSMTPPool:
+    def __init__(self):
+        self.smtp = MagicMock()
+        self.smtp.sendmail = AsyncMock()
+        self.sessions = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.sessions += 1
+        yield self.smtp
+
+
+@pytest.mark.asyncio
+async def test_queued_emails_share_one_smtp_session():
+    pool = FakeSMTPPool()
+    batcher = EmailBatcher(pool, batch_size=10, window_ms=20)
+    await asyncio.gather(*(batcher.submit(f"to{n}@example.com", "message") for n in range(5)))
+    assert pool.sessions == 1
+    assert pool.smtp.sendmail.await_count == 5
+
+
+@pytest.mark.asyncio
+async def test_failed_recipient_does_not_fail_the_batch():
+    pool = FakeSMTPPool()
+    pool.smtp.sendmail.side_effect = [None, ValueError("recipient refused"), None]
+    batcher = EmailBatcher(pool, batch_size=3, window_ms=20)
+    results = await asyncio.gather(*(batcher.submit(f"to{n}@example.com", "message") for n in range(3)),
+                                   return_exceptions=True)
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], ValueError)
+
+
+@pytest.mark.asyncio
+async def test_dropped_session_moves_the_rest_of_the_batch_to_a_fresh_one():
+    from aiosmtplib import SMTPServerDisconnected
+    pool = FakeSMTPPool()
+    pool.smtp.sendmail.side_effect = [None, SMTPServerDisconnected("gone"), None, None]
+    batcher = EmailBatcher(pool, batch_size=3, window_ms=20)
+    results = await asyncio.gather(*(batcher.submit(f"to{n}@example.com", "message") for n in range(3)))
+    assert results == [None, None, None]
+    assert pool.sessions == 2
+    assert pool.smtp.sendmail.await_count == 4
+
+
+@pytest.mark.asyncio
+async def test_batch_fails_when_the_fresh_session_drops_too():
+    from aiosmtplib import SMTPServerDisconnected
+    pool = FakeSMTPPool()
+    pool.smtp.sendmail.side_effect = SMTPServerDisconnected("gone")
+    batcher = EmailBatcher(pool, batch_size=2, window_ms=20)
+    results = await asyncio.gather(*(batcher.submit(f"to{n}@example.com", "message") for n in range(2)),
+                                   return_exceptions=True)
+    assert all(isinstance(result, SMTPServerDisconnected) for result in results)
+    assert pool.sessions == 2
+
+
+def test_sender_starts_the_idle_reaper_on_its_loop():
+    sender = EmailSender()
+    loop = sender.loop
+    try:
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result(timeout=1)
+        assert sender.smtp_pool._reaper is not None
+    finally:
+        asyncio.run_coroutine_threadsafe(sender.smtp_pool.close(), loop).result(timeout=1)
+        loop.call_soon_threadsafe(loop.stop)
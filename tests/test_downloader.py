@@ -0,0 +1,99 @@
+import time
+import pytest
+from unittest.mock import AsyncMock, patch
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from prometheus_client import REGISTRY
+from service.downloader import Bandwidth, DownloadError, RangedDownloader, run_queue
+from tests.test_proxy_service import MEDIA, media
+
+
+async def start_server(handler) -> TestServer:
+    app = web.Application()
+    app.router.add_get("/video.mp4", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def make_downloader(**kwargs):
+    options = dict(max_connections=4, connections_per_job=3, part_size=50_000, retries=2, retry_backoff=0.01)
+    options.update(kwargs)
+    return RangedDownloader(**options)
+
+
+@pytest.mark.asyncio
+async def test_file_is_assembled_from_parallel_ranges(tmp_path):
+    server, downloader = await start_server(media), make_downloader()
+    progress = []
+    try:
+        path = str(tmp_path / "video.mp4")
+        size = await downloader.download(str(server.make_url("/video.mp4")), path,
+                                         progress=lambda done, total: progress.append((done, total)))
+    finally:
+        await downloader.close()
+        await server.close()
+    assert size == len(MEDIA)
+    assert open(path, "rb").read() == MEDIA
+    assert progress[-1] == (len(MEDIA), len(MEDIA))
+    assert not (tmp_path / "video.mp4.part").exists()
+
+
+@pytest.mark.asyncio
+async def test_interrupted_range_is_resumed(tmp_path):
+    failed = set()
+
+    async def flaky(request):
+        start = request.headers["Range"].removeprefix("bytes=").split("-")[0]
+        if start == "50000" and start not in failed:
+            failed.add(start)
+            response = web.StreamResponse(status=206, headers={"Content-Length": "50000"})
+            await response.prepare(request)
+            await response.write(MEDIA[50000:51000])
+            request.transport.close()
+            return response
+        return await media(request)
+
+    retries = REGISTRY.get_sample_value("downloader_range_retries_total") or 0
+    server, downloader = await start_server(flaky), make_downloader()
+    try:
+        path = str(tmp_path / "video.mp4")
+        await downloader.download(str(server.make_url("/video.mp4")), path)
+    finally:
+        await downloader.close()
+        await server.close()
+    assert open(path, "rb").read() == MEDIA
+    assert REGISTRY.get_sample_value("downloader_range_retries_total") == retries + 1
+
+
+@pytest.mark.asyncio
+async def test_server_without_ranges_is_refused(tmp_path):
+    async def whole(request):
+        return web.Response(body=MEDIA)
+
+    server, downloader = await start_server(whole), make_downloader()
+    try:
+        with pytest.raises(DownloadError):
+            await downloader.download(str(server.make_url("/video.mp4")), str(tmp_path / "video.mp4"))
+    finally:
+        await downloader.close()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_bandwidth_budget_paces_consumers():
+    bandwidth = Bandwidth(rate=100_000)
+    started_at = time.monotonic()
+    for _ in range(3):
+        await bandwidth.consume(100_000)
+    assert time.monotonic() - started_at >= 1.9
+
+
+@pytest.mark.asyncio
+async def test_malformed_queue_line_is_skipped(tmp_path):
+    items = [("youtube", "7t2alSnE2-I"), ("youtube", "7t2alSnE2-I", "mp4")]
+    with patch("service.downloader.download_video", new_callable=AsyncMock) as download:
+        failures = await run_queue(items, str(tmp_path), jobs=1)
+    assert failures == 1
+    download.assert_awaited_once()
+    assert download.call_args.args[:3] == ("youtube", "7t2alSnE2-I", "mp4")
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+import time
+import pytest
+from service.executor import ExtractionExecutor
+
+
+@pytest.mark.asyncio
+async def test_per_source_concurrency_is_capped():
+    executor = ExtractionExecutor(max_workers=8, limits={"instagram": 2, "youtube": 4})
+    running = {"instagram": 0, "youtube": 0}
+    peak = {"instagram": 0, "youtube": 0}
+    lock = threading.Lock()
+
+    def get_stream(source):
+        with lock:
+            running[source] += 1
+            peak[source] = max(peak[source], running[source])
+        time.sleep(0.02)
+        with lock:
+            running[source] -= 1
+        return source
+
+    tasks = [executor.run(source, get_stream, source) for source in ("instagram", "youtube") for _ in range(8)]
+    results = await asyncio.gather(*tasks)
+    executor.shutdown()
+
+    assert results.count("instagram") == 8
+    assert peak["instagram"] == 2
+    assert peak["youtube"] == 4
+    assert executor.queue_depth() == 0
@@ -0,0 +1,122 @@
+import threading
+import time
+import instaloader
+import pytest
+from unittest.mock import patch
+from service.instagram_service import InstaloaderPool
+
+
+class FakeInstaloader:
+    created = []
+
+    def __init__(self, **kwargs):
+        self.logins = 0
+        self.loaded_from = None
+        FakeInstaloader.created.append(self)
+
+    def load_session_from_file(self, username, filename):
+        with open(filename) as f:
+            self.loaded_from = f.read()
+
+    def login(self, user, passwd):
+        self.logins += 1
+
+    def save_session_to_file(self, filename):
+        with open(filename, "w") as f:
+            f.write("session")
+
+    def test_login(self):
+        return None
+
+
+@pytest.fixture
+def fake_instaloader():
+    FakeInstaloader.created = []
+    with patch("instaloader.Instaloader", FakeInstaloader):
+        yield FakeInstaloader
+
+
+def test_sessions_are_persisted_and_reused(fake_instaloader, tmp_path):
+    pool = InstaloaderPool(1, str(tmp_path), username="user", password="secret")
+    with pool.lease() as loader:
+        assert loader.logins == 1
+    with pool.lease() as again:
+        assert again is loader
+    assert loader.logins == 1
+
+    restarted = InstaloaderPool(1, str(tmp_path), username="user", password="secret")
+    with restarted.lease() as loader:
+        assert loader.logins == 0
+        assert loader.loaded_from == "session"
+
+
+def test_pool_size_caps_concurrent_leases(fake_instaloader, tmp_path):
+    pool = InstaloaderPool(2, str(tmp_path), username="user", password="secret")
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def call():
+        nonlocal active, peak
+        with pool.lease():
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    assert peak == 2
+    assert len(fake_instaloader.created) == 2
+
+
+def test_expired_session_is_logged_in_again(fake_instaloader, tmp_path):
+    pool = InstaloaderPool(1, str(tmp_path), username="user", password="secret")
+    with pytest.raises(instaloader.exceptions.LoginRequiredException):
+        with pool.lease():
+            raise instaloader.exceptions.LoginRequiredException("login required")
+    with pool.lease() as loader:
+        assert loader.logins == 2
+
+    pool.refresh()
+    assert loader.logins == 3
+
+
+def test_waiter_creates_the_instance_when_another_create_fails(fake_instaloader, tmp_path):
+    pool = InstaloaderPool(1, str(tmp_path), username="user", password="secret")
+    creating, fail = threading.Event(), threading.Event()
+    create = pool._create
+
+    def failing_create(index):
+        creating.set()
+        fail.wait(1)
+        raise ConnectionError("login failed")
+
+    errors, leased = [], []
+
+    def failed_lease():
+        try:
+            with pool.lease():
+                pass
+        except ConnectionError as e:
+            errors.append(e)
+
+    def waiter():
+        with pool.lease() as loader:
+            leased.append(loader)
+
+    pool._create = failing_create
+    first = threading.Thread(target=failed_lease)
+    first.start()
+    creating.wait(1)
+    pool._create = create
+    second = threading.Thread(target=waiter)
+    second.start()
+    time.sleep(0.05)
+    fail.set()
+    first.join(1)
+    second.join(1)
+    assert not second.is_alive()
+    assert len(errors) == 1 and len(leased) == 1
@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+import fakeredis
+from fastapi import HTTPException
+from schemas.job import Job
+from service.job_service import JobService
+
+
+def make_service():
+    service = JobService(ttl=60)
+    service._redis = fakeredis.FakeAsyncRedis()
+    return service
+
+
+def make_job():
+    return Job(kind="download_link", source="youtube", video_id="7t2alSnE2-I", fmt="mp4", email="test@example.com")
+
+
+@pytest.mark.asyncio
+async def test_submitted_job_is_popped_and_processed():
+    service = make_service()
+    job = make_job()
+    await service.submit(job)
+    assert await service.queue_length() == 1
+
+    popped = await service.next_job(timeout=1)
+    assert popped.id == job.id
+    done = await service.process(popped, lambda job: service.update(job, status="done", result={"url": "u"}))
+    assert (await service.get(job.id)).result == {"url": "u"}
+    assert done.finished
+
+
+@pytest.mark.asyncio
+async def test_handler_errors_fail_the_job():
+    service = make_service()
+
+    async def not_found(job):
+        raise HTTPException(status_code=404, detail="Format is not available")
+
+    job = await service.process(make_job(), not_found)
+    assert (job.status, job.status_code, job.detail) == ("failed", 404, "Format is not available")
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_refused(monkeypatch):
+    service = make_service()
+    monkeypatch.setattr("service.job_service.settings.job_max_queue", 1)
+    await service.submit(make_job())
+    with pytest.raises(HTTPException) as e:
+        await service.submit(make_job())
+    assert e.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_events_follow_the_job_until_it_finishes():
+    service = make_service()
+    job = make_job()
+    await service.submit(job)
+    seen = []
+
+    async def follow():
+        async for event in service.events(job.id, keepalive=0.05, timeout=5):
+            seen.append(event.status if event else None)
+
+    follower = asyncio.create_task(follow())
+    await asyncio.sleep(0.12)
+    job = await service.update(job, status="running")
+    await service.update(job, status="done")
+    await asyncio.wait_for(follower, 2)
+    assert seen[0] == "queued"
+    assert None in seen
+    assert [status for status in seen if status][-2:] == ["running", "done"]
+
+
+@pytest.mark.asyncio
+async def test_stopped_worker_puts_its_running_job_back():
+    service = make_service()
+    job = make_job()
+    started = asyncio.Event()
+
+    async def slow(job):
+        started.set()
+        await asyncio.sleep(10)
+
+    await service.submit(job)
+    service.start(slow, workers=1)
+    await asyncio.wait_for(started.wait(), 2)
+    await service.stop()
+    assert (await service.get(job.id)).status == "queued"
+    assert (await service.next_job(timeout=1)).id == job.id
+
+
+@pytest.mark.asyncio
+async def test_jobs_of_a_dead_worker_are_requeued():
+    dead, alive = make_service(), make_service()
+    alive._redis = dead._redis
+    job = make_job()
+    await dead.submit(job)
+    await dead._redis.sadd("jobs:workers", dead.worker_id)
+    assert (await dead.next_job(timeout=1)).id == job.id
+    assert await alive.requeue_stale() == 1
+    assert (await alive.next_job(timeout=1)).id == job.id
+    await alive.process(job, lambda job: alive.update(job, status="done"))
+    assert await alive._redis.llen(f"jobs:processing:{alive.worker_id}") == 0
@@ -0,0 +1,22 @@
+import json
+import logger as logging_setup
+from logger import get_logger
+
+
+def test_handler_is_registered_once_and_writes_json(tmp_path):
+    filename = str(tmp_path / "test.log")
+    first = get_logger(filename)
+    second = get_logger(filename)
+    assert first is second
+    assert len(first.handlers) == 1
+
+    first.info("request", extra={"fields": {"method": "GET", "status": 200}})
+    logging_setup._listeners[filename].stop()
+    del logging_setup._listeners[filename]
+
+    lines = open(filename).read().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record["message"] == "request"
+    assert record["level"] == "INFO"
+    assert (record["method"], record["status"]) == ("GET", 200)
@@ -0,0 +1,79 @@
+import asyncio
+import fakeredis
+import pytest
+from unittest.mock import patch
+from prometheus_client import REGISTRY
+from service.redis_service import RedisService
+from service.manifest_service import _extract, manifest_key, Source
+from schemas.manifest import VideoManifest, StreamInfo
+from settings import settings
+
+VIDEO_ID = "7t2alSnE2-I"
+LOCK_KEY = f"lock:{manifest_key(Source.youtube, VIDEO_ID)}"
+
+
+def make_manifest():
+    return VideoManifest(source="youtube", video_id=VIDEO_ID, title="Video", duration=60, streams=[
+        StreamInfo(mime_type="video/mp4", subtype="mp4", resolution="720p", url="http://fakeurl.com/video.mp4")])
+
+
+def make_replica(server):
+    replica = RedisService()
+    replica._redis = fakeredis.aioredis.FakeRedis(server=server)
+    return replica
+
+
+def replica_hits():
+    return REGISTRY.get_sample_value("extraction_coalesced_requests_total",
+                                     {"source": "youtube", "scope": "replica"}) or 0
+
+
+@pytest.mark.asyncio
+async def test_replicas_share_one_extraction():
+    server = fakeredis.FakeServer()
+    first, second = make_replica(server), make_replica(server)
+    calls = 0
+
+    async def fetch_manifest(self):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return make_manifest()
+
+    before = replica_hits()
+    with patch("utils.BaseService.fetch_manifest", fetch_manifest), \
+            patch.object(settings, "extraction_lock_poll_interval", 0.01):
+        leader = asyncio.create_task(_extract(Source.youtube, VIDEO_ID, first))
+        await asyncio.sleep(0.01)
+        follower = await _extract(Source.youtube, VIDEO_ID, second)
+        assert await leader == follower == make_manifest()
+    assert calls == 1
+    assert replica_hits() == before + 1
+    assert not await first.is_locked(LOCK_KEY)
+
+
+@pytest.mark.asyncio
+async def test_lock_is_released_when_the_extractor_fails():
+    server = fakeredis.FakeServer()
+    first, second = make_replica(server), make_replica(server)
+    calls = 0
+
+    async def fetch_manifest(self):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        raise ValueError("extraction failed")
+
+    before = replica_hits()
+    with patch("utils.BaseService.fetch_manifest", fetch_manifest), \
+            patch.object(settings, "extraction_lock_poll_interval", 0.01):
+        leader = asyncio.create_task(_extract(Source.youtube, VIDEO_ID, first))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ValueError):
+            await _extract(Source.youtube, VIDEO_ID, second)
+        with pytest.raises(ValueError):
+            await leader
+    # the follower saw the lock go away without a result and extracted itself
+    assert calls == 2
+    assert replica_hits() == before
+    assert not await first.is_locked(LOCK_KEY)
@@ -0,0 +1,107 @@
+import os
+import asyncio
+import aiohttp
+import pytest
+from service.media_cache import MediaCache, CachedFileResponse, served_bytes, INDEX_FILE
+from tests.test_proxy_service import MEDIA, start_upstream
+
+
+async def fill(cache, key, url, session):
+    cache.schedule_fill(key, url, "video/mp4", session)
+    await asyncio.gather(*cache._fills.values())
+
+
+@pytest.mark.asyncio
+async def test_filled_file_is_indexed_and_survives_restart(tmp_path):
+    upstream = await start_upstream()
+    try:
+        cache = MediaCache(str(tmp_path), max_bytes=10 * len(MEDIA), max_file_bytes=len(MEDIA), fill_concurrency=2)
+        cache.start()
+        async with aiohttp.ClientSession() as session:
+            await fill(cache, ("youtube", "a", "mp4"), str(upstream.make_url("/video.mp4")), session)
+        path, entry = cache.lookup(("youtube", "a", "mp4"))
+        assert open(path, "rb").read() == MEDIA
+        assert entry["size"] == len(MEDIA)
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+        (tmp_path / "orphan.media").write_bytes(b"x")
+        (tmp_path / "notes.txt").write_bytes(b"x")
+        (tmp_path / "nested.media").mkdir()
+        restarted = MediaCache(str(tmp_path), max_bytes=10 * len(MEDIA), max_file_bytes=len(MEDIA),
+                               fill_concurrency=2)
+        restarted.start()
+        assert restarted.lookup(("youtube", "a", "mp4"))[0] == path
+        assert restarted.size == len(MEDIA)
+        assert not (tmp_path / "orphan.media").exists()
+        assert (tmp_path / "notes.txt").exists()
+        assert (tmp_path / "nested.media").is_dir()
+    finally:
+        await upstream.close()
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_file_is_evicted(tmp_path):
+    upstream = await start_upstream()
+    url = str(upstream.make_url("/video.mp4"))
+    try:
+        cache = MediaCache(str(tmp_path), max_bytes=2 * len(MEDIA), max_file_bytes=len(MEDIA), fill_concurrency=2)
+        cache.start()
+        async with aiohttp.ClientSession() as session:
+            await fill(cache, ("youtube", "a", "mp4"), url, session)
+            await fill(cache, ("youtube", "b", "mp4"), url, session)
+            cache.lookup(("youtube", "a", "mp4"))
+            await fill(cache, ("youtube", "c", "mp4"), url, session)
+        assert cache.lookup(("youtube", "b", "mp4")) is None
+        assert cache.lookup(("youtube", "a", "mp4")) is not None
+        assert cache.size == 2 * len(MEDIA)
+        assert len(os.listdir(tmp_path)) == 3  # two files and the index
+        assert INDEX_FILE in os.listdir(tmp_path)
+    finally:
+        await upstream.close()
+
+
+@pytest.mark.asyncio
+async def test_file_being_served_is_not_evicted(tmp_path):
+    upstream = await start_upstream()
+    url = str(upstream.make_url("/video.mp4"))
+    try:
+        cache = MediaCache(str(tmp_path), max_bytes=len(MEDIA), max_file_bytes=len(MEDIA), fill_concurrency=2)
+        cache.start()
+        async with aiohttp.ClientSession() as session:
+            await fill(cache, ("youtube", "a", "mp4"), url, session)
+            path, entry = cache.lookup(("youtube", "a", "mp4"))
+            response = CachedFileResponse(cache, path, entry)
+            await fill(cache, ("youtube", "b", "mp4"), url, session)
+            assert os.path.exists(path)
+            assert cache.lookup(("youtube", "b", "mp4")) is None
+
+            response.release()
+            response.release()
+            await fill(cache, ("youtube", "c", "mp4"), url, session)
+        assert not os.path.exists(path)
+        assert cache.lookup(("youtube", "c", "mp4")) is not None
+        assert cache.size == len(MEDIA)
+    finally:
+        await upstream.close()
+
+
+@pytest.mark.asyncio
+async def test_oversized_download_is_discarded(tmp_path):
+    upstream = await start_upstream()
+    try:
+        cache = MediaCache(str(tmp_path), max_bytes=10 * len(MEDIA), max_file_bytes=1000, fill_concurrency=2)
+        cache.start()
+        async with aiohttp.ClientSession() as session:
+            await fill(cache, ("youtube", "a", "mp4"), str(upstream.make_url("/video.mp4")), session)
+        assert cache.lookup(("youtube", "a", "mp4")) is None
+        assert os.listdir(tmp_path) == []
+    finally:
+        await upstream.close()
+
+
+def test_served_bytes_follows_the_range():
+    assert served_bytes(None, 100) == 100
+    assert served_bytes("bytes=10-19", 100) == 10
+    assert served_bytes("bytes=90-", 100) == 10
+    assert served_bytes("bytes=-30", 100) == 30
+    assert served_bytes("bytes=0-9,20-29", 100) == 100
@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from service.password_service import PasswordHasher, pwd_context
+
+fast_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_verify_runs_off_the_loop_and_rehashes_outdated_cost(hasher):
+    valid, new_hash = await hasher.verify("secret", fast_context.hash("secret"))
+    assert valid
+    assert new_hash is not None
+    assert pwd_context.verify("secret", new_hash)
+    assert not pwd_context.needs_update(new_hash)
+
+    assert await hasher.verify("wrong", fast_context.hash("secret")) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_requests_beyond_the_queue_are_rejected(hasher):
+    hashed = fast_context.hash("secret")
+    results = await asyncio.gather(*(hasher.verify("wrong", hashed) for _ in range(3)), return_exceptions=True)
+    rejected = [res for res in results if isinstance(res, HTTPException)]
+    assert len(rejected) == 1
+    assert rejected[0].status_code == 503
+    assert rejected[0].headers == {"Retry-After": "1"}
@@ -0,0 +1,100 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from prometheus_client import REGISTRY
+from starlette.requests import ClientDisconnect
+from service.proxy_service import StreamProxy, ProxyResponse
+
+MEDIA = bytes(range(256)) * 1024
+
+
+async def media(request: web.Request) -> web.Response:
+    headers = {"Accept-Ranges": "bytes", "Content-Type": "video/mp4", "ETag": '"v1"'}
+    range_header = request.headers.get("Range")
+    if range_header is None or request.headers.get("If-Range", '"v1"') != '"v1"':
+        return web.Response(body=MEDIA, headers=headers)
+    start, end = range_header.removeprefix("bytes=").split("-")
+    start, end = int(start), int(end) if end else len(MEDIA) - 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(MEDIA)}"
+    return web.Response(status=206, body=MEDIA[start:end + 1], headers=headers)
+
+
+async def start_upstream() -> TestServer:
+    app = web.Application()
+    app.router.add_get("/video.mp4", media)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def make_proxy(max_concurrency=2):
+    return StreamProxy(chunk_size=4096, max_concurrency=max_concurrency, pool_size=4,
+                       connect_timeout=5, read_timeout=5)
+
+
+def streamed_bytes():
+    return REGISTRY.get_sample_value("proxy_bytes_total", {"source": "youtube"}) or 0
+
+
+@pytest.mark.asyncio
+async def test_range_is_passed_through_in_fixed_size_chunks():
+    upstream, proxy = await start_upstream(), make_proxy()
+    before = streamed_bytes()
+    try:
+        assert proxy.try_acquire()
+        response = await proxy.open(str(upstream.make_url("/video.mp4")), {"Range": "bytes=1000-20999"})
+        assert response.status == 206
+        headers = proxy.response_headers(response)
+        assert headers["Content-Range"] == f"bytes 1000-20999/{len(MEDIA)}"
+        chunks = [chunk async for chunk in proxy.iter_body(response, "youtube")]
+        assert b"".join(chunks) == MEDIA[1000:21000]
+        assert max(len(chunk) for chunk in chunks) <= 4096
+        assert streamed_bytes() == before + 20000
+    finally:
+        await proxy.close()
+        await upstream.close()
+
+
+@pytest.mark.asyncio
+async def test_stale_if_range_gets_the_whole_body():
+    upstream, proxy = await start_upstream(), make_proxy()
+    try:
+        assert proxy.try_acquire()
+        response = await proxy.open(str(upstream.make_url("/video.mp4")),
+                                    {"Range": "bytes=0-9", "If-Range": '"v0"'})
+        assert response.status == 200
+        assert len(b"".join([chunk async for chunk in proxy.iter_body(response, "youtube")])) == len(MEDIA)
+    finally:
+        await proxy.close()
+        await upstream.close()
+
+
+@pytest.mark.asyncio
+async def test_slot_is_freed_when_the_client_leaves_before_the_body():
+    upstream, proxy = await start_upstream(), make_proxy(max_concurrency=1)
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client went away")
+
+    try:
+        assert proxy.try_acquire()
+        response = ProxyResponse(proxy, await proxy.open(str(upstream.make_url("/video.mp4")), {}), "youtube")
+        with pytest.raises(ClientDisconnect):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        assert proxy.active == 0
+        response.release()
+        assert proxy.active == 0
+    finally:
+        await proxy.close()
+        await upstream.close()
+
+
+def test_download_slots_are_capped():
+    proxy = make_proxy(max_concurrency=1)
+    assert proxy.try_acquire()
+    assert not proxy.try_acquire()
+    proxy.release()
+    assert proxy.try_acquire()
@@ -0,0 +1,72 @@
+import asyncio
+import time
+import pytest
+import fakeredis
+from service.redis_service import RedisService, LocalCache
+
+
+def make_service(server):
+    service = RedisService()
+    service._redis = fakeredis.aioredis.FakeRedis(server=server)
+    service.l1 = LocalCache(max_bytes=1024, max_ttl=60)
+    service.register_local_cache(service.l1)
+    return service
+
+
+def test_local_cache_evicts_least_recently_used_within_budget():
+    cache = LocalCache(max_bytes=30, max_ttl=60)
+    cache.set("a", b"0123456789", 60)
+    cache.set("b", b"0123456789", 60)
+    cache.get("a")
+    cache.set("c", b"0123456789", 60)
+    assert cache.get("a") == b"0123456789"
+    assert cache.get("b") is None
+    assert cache.size <= 30
+
+
+def test_local_cache_expires_entries():
+    cache = LocalCache(max_bytes=1024, max_ttl=0.01)
+    cache.set("a", b"value", 60)
+    assert cache.get("a") == b"value"
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.size == 0
+
+
+@pytest.mark.asyncio
+async def test_l1_serves_hot_keys_without_redis():
+    service = make_service(fakeredis.FakeServer())
+    await service._redis.set("key", b"http://fakeurl.com/video.mp4", ex=120)
+    assert await service.get_cache("key") == b"http://fakeurl.com/video.mp4"
+    await service._redis.delete("key")
+    assert await service.get_cache("key") == b"http://fakeurl.com/video.mp4"
+
+
+@pytest.mark.asyncio
+async def test_write_on_one_replica_invalidates_the_others():
+    server = fakeredis.FakeServer()
+    first, second = make_service(server), make_service(server)
+    first.start()
+    await asyncio.sleep(0.05)
+
+    await second.set_cache("key", "old", expire=120)
+    assert await first.get_cache("key") == b"old"
+    await second.set_cache("key", "new", expire=120)
+    await asyncio.sleep(0.05)
+
+    assert await first.get_cache("key") == b"new"
+    assert await second.get_cache("key") == b"new"
+    await first.stop()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_refuses_when_any_bucket_is_empty():
+    service = make_service(fakeredis.FakeServer())
+    user, source = ("ratelimit:youtube:alice", 2, 1.0), ("ratelimit:youtube", 3, 1.0)
+    assert await service.take_tokens([user, source]) == 0
+    assert await service.take_tokens([user, source]) == 0
+    wait = await service.take_tokens([user, source])
+    assert 0 < wait <= 1
+    # the refused request took nothing from the source bucket
+    assert await service.take_tokens([("ratelimit:youtube:bob", 2, 1.0), source]) == 0
+    assert await service.take_tokens([("ratelimit:youtube:carol", 2, 1.0), source]) > 0
@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from service.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def extract():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"url": "http://fakeurl.com/video.mp4"}
+
+    results = await asyncio.gather(*(flight.do("key", extract) for _ in range(10)))
+    assert calls == 1
+    assert [shared for _, shared in results].count(False) == 1
+    assert all(res == {"url": "http://fakeurl.com/video.mp4"} for res, _ in results)
+    assert not flight.in_flight("key")
+
+
+@pytest.mark.asyncio
+async def test_failure_is_propagated_to_all_waiters():
+    flight = SingleFlight()
+
+    async def extract():
+        await asyncio.sleep(0.01)
+        raise ValueError("extraction failed")
+
+    results = await asyncio.gather(*(flight.do("key", extract) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(res, ValueError) for res in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def extract():
+        await asyncio.sleep(0.05)
+        return "manifest"
+
+    leader = asyncio.create_task(flight.do("key", extract))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("key", extract))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower == ("manifest", True)
+    assert leader.cancelled()
+    assert not flight.in_flight("key")
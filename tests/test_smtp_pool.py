@@ -0,0 +1,77 @@
+import asyncio
+import socket
+import pytest
+from aiosmtpd.controller import Controller
+from service.smtp_pool import SMTPPool
+
+
+class CollectingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = CollectingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+def make_pool(controller, **kwargs):
+    return SMTPPool(controller.hostname, controller.port, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_reused_across_messages(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller, max_size=2)
+    connects = 0
+    connect = pool._connect
+
+    async def counting_connect():
+        nonlocal connects
+        connects += 1
+        return await connect()
+
+    pool._connect = counting_connect
+    await asyncio.gather(*(pool.sendmail("from@example.com", f"to{n}@example.com", "Subject: hi\n\nbody")
+                           for n in range(10)))
+    await pool.close()
+
+    assert len(handler.messages) == 10
+    assert connects == 2
+
+
+@pytest.mark.asyncio
+async def test_idle_sessions_are_evicted(smtp_server):
+    controller, _ = smtp_server
+    pool = make_pool(controller, idle_timeout=0)
+    await pool.sendmail("from@example.com", "to@example.com", "Subject: hi\n\nbody")
+    assert pool.size == 1
+    await asyncio.sleep(0.01)
+    await pool.evict_idle()
+    assert pool.size == 0
+
+
+@pytest.mark.asyncio
+async def test_dropped_session_is_replaced(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller)
+    await pool.sendmail("from@example.com", "to@example.com", "Subject: hi\n\nbody")
+    smtp, _ = pool._idle[0]
+    smtp.transport.close()
+    await pool.sendmail("from@example.com", "to@example.com", "Subject: hi\n\nbody")
+    await pool.close()
+    assert len(handler.messages) == 2
@@ -0,0 +1,60 @@
+import time
+import pytest
+from settings import settings
+from utils import stream_cache_ttl, url_expires_at, is_valid, compile_pattern, manifest_refresh_ahead
+
+
+def test_ttl_follows_googlevideo_expire_minus_margin():
+    expire = int(time.time()) + 3600
+    url = f"https://rr1---sn.googlevideo.com/videoplayback?expire={expire}&itag=18"
+    ttl = stream_cache_ttl(url)
+    assert 3600 - settings.cache_expiry_margin - 2 <= ttl <= 3600 - settings.cache_expiry_margin
+
+
+def test_instagram_oe_is_read_as_hex():
+    url = "https://scontent.cdninstagram.com/v/t50.mp4?oe=65A1B2C3"
+    assert url_expires_at(url) == 0x65A1B2C3
+
+
+def test_ttl_is_capped_and_defaults_without_expiry():
+    far = int(time.time()) + 10 * settings.cache_max_ttl
+    assert stream_cache_ttl(f"https://googlevideo.com/videoplayback?expire={far}") == settings.cache_max_ttl
+    assert stream_cache_ttl("http://fakeurl.com/video.mp4") == settings.cache_default_ttl
+
+
+def test_ttl_is_zero_for_urls_inside_the_margin():
+    expire = int(time.time()) + settings.cache_expiry_margin // 2
+    assert stream_cache_ttl(f"https://googlevideo.com/videoplayback?expire={expire}") == 0
+
+
+def test_video_ids_are_checked_against_the_source_pattern():
+    from fastapi import HTTPException
+    from service.youtube_service import YoutubeService
+    assert YoutubeService("7t2alSnE2-I").is_valid_id()
+    for video_id in ("7t2alSnE2-", "7t2alSnE2-I\n", "7t2alSnE2-!", "' OR 1=1 --"):
+        service = YoutubeService(video_id)
+        assert not service.is_valid_id()
+        with pytest.raises(HTTPException) as error:
+            service.check_id()
+        assert error.value.status_code == 422
+
+
+def test_is_valid_compiles_each_pattern_once():
+    compile_pattern.cache_clear()
+    for _ in range(3):
+        assert is_valid(r"^\d+$", "123")
+    assert compile_pattern.cache_info().misses == 1
+
+
+def test_refresh_ahead_stays_inside_the_default_ttl():
+    from schemas.manifest import VideoManifest, StreamInfo
+    expire = int(time.time()) + 3600
+
+    def manifest(*urls):
+        return VideoManifest(source="youtube", video_id="7t2alSnE2-I", title="Video", duration=1,
+                             streams=[StreamInfo(mime_type="video/mp4", subtype="mp4", url=url) for url in urls])
+
+    signed = f"https://googlevideo.com/videoplayback?expire={expire}"
+    assert manifest_refresh_ahead(manifest(signed)) == settings.cache_refresh_ahead
+    assert manifest_refresh_ahead(manifest(signed, "http://fakeurl.com/video.mp4")) < settings.cache_default_ttl
+    assert manifest_refresh_ahead(manifest()) < settings.cache_default_ttl
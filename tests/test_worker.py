@@ -0,0 +1,71 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from worker import RetryScheduler, PARKING_QUEUE, QUEUE_NAME
+
+
+@pytest.fixture
+def channel():
+    channel = MagicMock()
+    channel.default_exchange.publish = AsyncMock()
+    channel.declare_queue = AsyncMock()
+    return channel
+
+
+def published(channel):
+    message = channel.default_exchange.publish.call_args.args[0]
+    return message, channel.default_exchange.publish.call_args.kwargs["routing_key"]
+
+
+def test_delay_grows_exponentially_up_to_max(channel):
+    scheduler = RetryScheduler(channel, base_delay_ms=1000, max_delay_ms=5000, max_retries=5)
+    assert [scheduler.tier_delay_ms(attempts) for attempts in range(1, 6)] == [1000, 2000, 4000, 5000, 5000]
+    assert scheduler.queues == ["email_retry_1000ms", "email_retry_2000ms",
+                                "email_retry_4000ms", "email_retry_5000ms"]
+
+
+@pytest.mark.asyncio
+async def test_delay_queues_dead_letter_back_to_email_queue(channel):
+    scheduler = RetryScheduler(channel, base_delay_ms=1000, max_delay_ms=5000, max_retries=2)
+    await scheduler.declare()
+    arguments = channel.declare_queue.call_args_list[0].kwargs["arguments"]
+    assert arguments == {"x-dead-letter-exchange": "", "x-dead-letter-routing-key": QUEUE_NAME}
+
+
+@pytest.mark.asyncio
+async def test_failed_message_is_retried_with_the_tier_delay(channel):
+    scheduler = RetryScheduler(channel, base_delay_ms=1000, max_delay_ms=60000, max_retries=3)
+    await scheduler.schedule({"recipient": "test@example.com", "attempts": 2})
+    message, routing_key = published(channel)
+    assert routing_key == "email_retry_2000ms"
+    assert json.loads(message.body)["attempts"] == 3
+    assert int(message.properties.expiration) == 2000
+
+
+@pytest.mark.asyncio
+async def test_message_is_parked_after_max_retries(channel):
+    scheduler = RetryScheduler(channel, base_delay_ms=1000, max_delay_ms=60000, max_retries=3)
+    await scheduler.schedule({"recipient": "test@example.com", "attempts": 4})
+    message, routing_key = published(channel)
+    assert routing_key == PARKING_QUEUE
+    assert json.loads(message.body)["attempts"] == 4
+
+
+@pytest.mark.asyncio
+async def test_delivered_message_records_enqueue_to_delivery_delay(monkeypatch):
+    import time
+    import worker
+    from prometheus_client import REGISTRY
+
+    def delay_count():
+        return REGISTRY.get_sample_value("email_delivery_delay_seconds_count", {"transport": "rabbitmq"}) or 0
+
+    monkeypatch.setattr(worker, "send_email", AsyncMock())
+    message = MagicMock()
+    message.body = json.dumps({"recipient": "test@example.com", "subject": "s", "body": "b",
+                               "enqueued_at": time.time() - 5}).encode()
+    before = delay_count()
+    await worker.on_message(message)
+    assert delay_count() == before + 1
+    assert REGISTRY.get_sample_value("email_delivery_delay_seconds_bucket",
+                                     {"transport": "rabbitmq", "le": "2.5"}) == 0
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from service.youtube_api import YoutubeMetadataBatcher, parse_duration
+
+
+async def start_api(calls):
+    async def videos(request: web.Request) -> web.Response:
+        assert "key" not in request.query and request.headers["X-goog-api-key"] == "key"
+        ids = request.query["id"].split(",")
+        calls.append(ids)
+        items = [{"id": video_id, "snippet": {"title": f"Video {video_id}"},
+                  "contentDetails": {"duration": "PT1M5S"}}
+                 for video_id in ids if not video_id.startswith("missing")]
+        return web.json_response({"items": items})
+
+    app = web.Application()
+    app.router.add_get("/videos", videos)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def test_parse_duration():
+    assert parse_duration("PT1H2M3S") == 3723
+    assert parse_duration("P1DT5S") == 86405
+    assert parse_duration("PT0S") == 0
+    assert parse_duration("") is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_videos_list_calls():
+    calls = []
+    server = await start_api(calls)
+    batcher = YoutubeMetadataBatcher(str(server.make_url("/videos")), "key", window_ms=20)
+    try:
+        ids = [f"video{i:06d}" for i in range(60)]
+        results = await asyncio.gather(*(batcher.get(video_id) for video_id in ids))
+        assert sorted(len(call) for call in calls) == [10, 50]
+        assert results[0] == {"title": "Video video000000", "duration": 65}
+        assert all(result["title"] == f"Video {video_id}" for video_id, result in zip(ids, results))
+    finally:
+        await batcher.close()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_unknown_video_is_none():
+    calls = []
+    server = await start_api(calls)
+    batcher = YoutubeMetadataBatcher(str(server.make_url("/videos")), "key", window_ms=1)
+    try:
+        found, missing = await asyncio.gather(batcher.get("video000001"), batcher.get("missing0001"))
+        assert found["duration"] == 65
+        assert missing is None
+        assert len(calls) == 1
+    finally:
+        await batcher.close()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_caller_that_fills_the_batch_does_not_strand_the_others():
+    calls = []
+    server = await start_api(calls)
+    batcher = YoutubeMetadataBatcher(str(server.make_url("/videos")), "key", window_ms=1000, batch_size=2)
+    try:
+        first = asyncio.create_task(batcher.get("video000001"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(batcher.get("video000002"))
+        await asyncio.sleep(0)
+        second.cancel()
+        assert (await asyncio.wait_for(first, 1))["title"] == "Video video000001"
+        assert calls == [["video000001", "video000002"]]
+    finally:
+        await batcher.close()
+        await server.close()
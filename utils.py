@@ -1,19 +1,22 @@
 import re
+import time
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.user import User, UserRole
 from sqlalchemy.future import select
 from schemas.user import UserCreate
-from passlib.context import CryptContext
+from service.password_service import password_hasher
 from fastapi import HTTPException, status
 import abc
-from typing import Optional, Any, Annotated
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any, Annotated, Union
 from database import AsyncSessionLocal
+from service.executor import extraction_executor
+from service.user_cache import invalidate_user
+from settings import settings
+from schemas.manifest import VideoManifest, StreamInfo
 from enum import Enum
-
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from metrics import manifest_fetch_seconds, invalid_video_ids
 
 
 async def init_roles():
@@ -24,13 +27,32 @@ async def init_roles():
     ]
 
     async with AsyncSessionLocal() as session:
-        for role in INIT_ROLES:
-            existing_role = await get_role(role["name"], session)
-            if not existing_role:
-                new_role = UserRole(**role)
-                session.add(new_role)
+        if session.bind.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(UserRole).values(INIT_ROLES).on_conflict_do_nothing(index_elements=["name"])
+        await session.execute(stmt)
         await session.commit()
 
+
+class LazyTask:
+    """
+    Stands in for a celery task and imports its module on the first `.delay`,
+    so the web process does not load celery until it queues a job.
+    """
+
+    def __init__(self, module: str, name: str) -> None:
+        self.module = module
+        self.name = name
+        self._task = None
+
+    def delay(self, *args, **kwargs):
+        if self._task is None:
+            import importlib
+            self._task = getattr(importlib.import_module(self.module), self.name)
+        return self._task.delay(*args, **kwargs)
+
 async def get_user(user_name: str, db: AsyncSession) -> User:
     result = await db.execute(select(User).filter(User.username == user_name))
     return result.scalars().first()
@@ -46,7 +68,7 @@ async def create_user(db: AsyncSession, user: UserCreate):
     if not role:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Role not found")
 
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     db_user = User(username=user.username,
                    password_hash=hashed_password,
                    email=user.email,
@@ -54,15 +76,72 @@ async def create_user(db: AsyncSession, user: UserCreate):
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    await invalidate_user(db_user.username)
     return db_user
 
 
-def is_valid(pattern: str, id: str) -> bool:
-    regex = re.compile(pattern)
-    results = regex.match(id)
-    if not results:
-        return False
-    return True
+@lru_cache(maxsize=64)
+def compile_pattern(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def is_valid(pattern: Union[str, re.Pattern], id: str) -> bool:
+    """Whole-string match, so a trailing newline does not slip past a `$` anchor."""
+    return compile_pattern(pattern).fullmatch(id) is not None
+
+
+class VideoUnavailable(HTTPException):
+    """
+    The source answered that the video does not exist, is unavailable or is
+    private. Unlike other extraction errors it is worth caching, retrying
+    will not change it.
+    """
+
+
+def url_expires_at(url: str) -> Optional[int]:
+    """
+    Reads the expiry timestamp signed into an upstream stream URL:
+    `expire` (unix seconds) for googlevideo, `oe` (hex unix seconds) for Instagram CDN.
+    """
+    query = parse_qs(urlparse(url).query)
+    try:
+        if "expire" in query:
+            return int(query["expire"][0])
+        if "oe" in query:
+            return int(query["oe"][0], 16)
+    except ValueError:
+        return None
+    return None
+
+
+def stream_cache_ttl(url: str) -> int:
+    """
+    Cache TTL for a stream URL: its remaining lifetime minus a safety margin,
+    so a link served from cache is still valid when the user opens it.
+    """
+    expires_at = url_expires_at(url)
+    if expires_at is None:
+        return settings.cache_default_ttl
+    ttl = expires_at - int(time.time()) - settings.cache_expiry_margin
+    return max(0, min(ttl, settings.cache_max_ttl))
+
+
+def manifest_cache_ttl(manifest: VideoManifest) -> int:
+    """Cache TTL for a manifest: bounded by its earliest-expiring stream URL."""
+    if not manifest.streams:
+        return settings.cache_default_ttl
+    return min(stream_cache_ttl(stream.url) for stream in manifest.streams)
+
+
+def manifest_refresh_ahead(manifest: VideoManifest) -> float:
+    """
+    Seconds before expiry at which a cached manifest is revalidated. Manifests
+    with an unsigned stream URL are cached for `cache_default_ttl`, so they
+    get a fraction of it: a window longer than the TTL revalidates every hit.
+    """
+    if manifest.streams and all(url_expires_at(stream.url) is not None for stream in manifest.streams):
+        return settings.cache_refresh_ahead
+    return min(settings.cache_refresh_ahead, settings.cache_default_ttl * settings.cache_refresh_ahead_ratio)
 
 
 class VideoFormat(Enum):
@@ -72,16 +151,51 @@ class VideoFormat(Enum):
 
 
 class BaseService(abc.ABC):
+    name: str = "base"
+    formats: tuple = ()
+    id_pattern: Optional[re.Pattern] = None
+
     def __init__(self, content_id: str, fmt: Annotated[str, VideoFormat] = VideoFormat.MP4.value):
         self.content_id = content_id
         self.fmt = fmt
 
+    def check_format(self) -> None:
+        if self.formats and self.fmt not in self.formats:
+            raise HTTPException(status_code=400, detail=f"Unsupported format: {self.fmt}")
+
+    def is_valid_id(self) -> bool:
+        return self.id_pattern is None or is_valid(self.id_pattern, self.content_id)
+
+    def check_id(self) -> None:
+        """Rejects an id that can't exist before it costs a cache lookup or an extraction."""
+        if not self.is_valid_id():
+            invalid_video_ids.labels(source=self.name).inc()
+            raise HTTPException(status_code=422, detail=f"Invalid video ID: {self.content_id}")
+
     @abc.abstractmethod
-    def get_stream(self) -> Any:
+    def get_manifest(self) -> VideoManifest:
         ...
 
-    async def fetch_video_info(self) -> Any:
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as pool:
-            return await loop.run_in_executor(pool, self.get_stream)
+    def select_stream(self, manifest: VideoManifest) -> StreamInfo:
+        self.check_format()
+        stream = manifest.select(self.fmt)
+        if stream is None:
+            raise HTTPException(status_code=404, detail=f"Format not available: {self.fmt}")
+        return stream
 
+    def get_stream(self) -> Any:
+        manifest = self.get_manifest()
+        return manifest.video_info(self.select_stream(manifest))
+
+    async def fetch_manifest(self) -> VideoManifest:
+        started_at = time.perf_counter()
+        result = "error"
+        try:
+            manifest = await extraction_executor.run(self.name, self.get_manifest)
+            result = "ok"
+            return manifest
+        finally:
+            manifest_fetch_seconds.labels(source=self.name, result=result).observe(time.perf_counter() - started_at)
+
+    async def fetch_video_info(self) -> Any:
+        return await extraction_executor.run(self.name, self.get_stream)
@@ -1,29 +1,89 @@
+import time
 import asyncio
+from typing import Any, Dict, Optional
 from aio_pika import connect_robust, IncomingMessage, Message
-from aiosmtplib import SMTP
 from email.mime.text import MIMEText
 from email.header import Header
 from settings import settings
 import json
-import logging
-from logging.handlers import TimedRotatingFileHandler
+from logger import get_logger
+from service.smtp_pool import SMTPPool
+from prometheus_client import start_http_server
+from metrics import email_retries, email_parked, email_retry_queue_depth, email_delivery_delay_seconds
 
 
-logger = logging.getLogger(__name__)
-_log_format = f"%(asctime)s - [%(levelname)s] - %(filename)s - %(message)s"
-logger.setLevel(logging.INFO)
-handler = TimedRotatingFileHandler("worker.log", when='midnight', backupCount=10)
-handler.setFormatter(logging.Formatter(_log_format))
-logger.addHandler(handler)
+logger = get_logger('worker.log')
 QUEUE_NAME = "email_queue"
-DEAD_LETTER_QUEUE = "email_ttl_queue"
-MESSAGE_TTL = 1000
-DEAD_LETTER_EXCHANGE = "dlx"
-MAX_RETRIES = 3
-dead_letter_args = {
-            "x-message-ttl": MESSAGE_TTL,
-            "x-dead-letter-exchange": DEAD_LETTER_EXCHANGE
-        }
+RETRY_QUEUE_PREFIX = "email_retry"
+PARKING_QUEUE = "email_parking_queue"
+MAX_RETRIES = settings.email_max_retries
+smtp_pool = SMTPPool(settings.smtp_server, settings.smtp_port,
+                     username=settings.gmail_user, password=settings.gmail_password,
+                     max_size=settings.smtp_pool_size, idle_timeout=settings.smtp_idle_timeout)
+handler_slots = asyncio.Semaphore(settings.worker_concurrency)
+
+
+class RetryScheduler:
+    """
+    Delays failed messages with exponential backoff before they return to
+    QUEUE_NAME. Every retry attempt has its own delay queue that dead-letters
+    back into QUEUE_NAME. Every message of a tier expires after the same
+    delay: RabbitMQ only expires messages at the head of a queue, so a
+    jittered per-message delay would wait behind a longer one in its tier.
+    Messages that used up MAX_RETRIES are moved to PARKING_QUEUE.
+    """
+
+    def __init__(self, channel, base_delay_ms: int, max_delay_ms: int, max_retries: int) -> None:
+        self.channel = channel
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.max_retries = max_retries
+
+    def tier_delay_ms(self, attempts: int) -> int:
+        return min(self.base_delay_ms * 2 ** (attempts - 1), self.max_delay_ms)
+
+    def tier_queue(self, attempts: int) -> str:
+        return f"{RETRY_QUEUE_PREFIX}_{self.tier_delay_ms(attempts)}ms"
+
+    @property
+    def queues(self):
+        return sorted({self.tier_queue(attempts) for attempts in range(1, self.max_retries + 1)})
+
+    async def declare(self) -> None:
+        for name in self.queues:
+            await self.channel.declare_queue(name, durable=True, arguments={
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": QUEUE_NAME,
+            })
+        await self.channel.declare_queue(PARKING_QUEUE, durable=True)
+
+    async def schedule(self, body: Dict[str, Any]) -> None:
+        attempts = body.get("attempts", 1)
+        if attempts > self.max_retries:
+            await self.park(json.dumps(body).encode())
+            return
+
+        delay_ms = self.tier_delay_ms(attempts)
+        expiration = delay_ms / 1000
+        await self.channel.default_exchange.publish(
+            Message(body=json.dumps({**body, "attempts": attempts + 1}).encode(), expiration=expiration),
+            routing_key=self.tier_queue(attempts),
+        )
+        email_retries.labels(attempt=str(attempts)).inc()
+        logger.info(f"Message scheduled for retry {attempts} of {self.max_retries} in {expiration:.1f}s")
+
+    async def park(self, body: bytes) -> None:
+        await self.channel.default_exchange.publish(Message(body=body), routing_key=PARKING_QUEUE)
+        email_parked.inc()
+        logger.error("Message moved to parking queue")
+
+    async def report_depth(self) -> None:
+        for name in self.queues + [PARKING_QUEUE]:
+            queue = await self.channel.declare_queue(name, passive=True)
+            email_retry_queue_depth.labels(queue=name).set(queue.declaration_result.message_count)
+
+
+retry_scheduler: Optional[RetryScheduler] = None
 
 async def send_email(to_email, subject, body):#
     try:
@@ -32,45 +92,63 @@ async def send_email(to_email, subject, body):#
         msg['To'] = Header(to_email, 'utf-8')
         msg['Subject'] = Header(subject, 'utf-8')
         message = msg.as_string()
-        async with SMTP(hostname=settings.smtp_server, port=settings.smtp_port) as smtp:
-            await smtp.login(settings.gmail_user, settings.gmail_password)
-            await smtp.sendmail(settings.gmail_user, to_email, message)
-            logger.info(f"Email sent to {to_email}")
+        await smtp_pool.sendmail(settings.gmail_user, to_email, message)
+        logger.info(f"Email sent to {to_email}")
     except Exception as e:
         logger.error(f"Impossible sent message to {to_email}, reason <{str(e)}>")
         raise
 
 
 async def on_message(message: IncomingMessage):
-    async with message.process(ignore_processed=True):
+    async with handler_slots, message.process(ignore_processed=True):
         try:
             body = json.loads(message.body)
-            recipient = body["recipient"]
-            subject = body["subject"]
-            body_content = body["body"]
-            await send_email(recipient, subject, body_content)
-            await message.ack()
+        except ValueError as e:
+            logger.error(f"Malformed message: {e}")
+            await retry_scheduler.park(message.body)
+            return
+        try:
+            await send_email(body["recipient"], body["subject"], body["body"])
         except Exception as e:
             logger.error(f"Error processing message: {e}")
-            connection = await connect_robust(settings.rabbitmq_url)
-            async with connection:
-                channel = await connection.channel()
-                await channel.default_exchange.publish(
-                    message, routing_key=DEAD_LETTER_QUEUE
-                )
-                logger.info("Message sent to dead letter queue")
+            await retry_scheduler.schedule(body)
+            return
+        if "enqueued_at" in body:
+            email_delivery_delay_seconds.labels(transport="rabbitmq").observe(time.time() - body["enqueued_at"])
+
+
+async def report_retry_depth():
+    while True:
+        try:
+            await retry_scheduler.report_depth()
+        except Exception as e:
+            logger.error(f"Impossible to read retry queue depth, reason <{str(e)}>")
+        await asyncio.sleep(settings.email_retry_depth_interval)
 
 
 async def main():
+    global retry_scheduler
+    start_http_server(settings.worker_metrics_port)
     connection = await connect_robust(settings.rabbitmq_url)
     async with connection:
         channel = await connection.channel()
-        await channel.set_qos(prefetch_count=1)
+        await channel.set_qos(prefetch_count=settings.worker_prefetch_count)
+        smtp_pool.start()
+
+        retry_scheduler = RetryScheduler(channel,
+                                         base_delay_ms=settings.email_retry_base_delay_ms,
+                                         max_delay_ms=settings.email_retry_max_delay_ms,
+                                         max_retries=MAX_RETRIES)
+        await retry_scheduler.declare()
+        depth_reporter = asyncio.create_task(report_retry_depth())
 
         queue = await channel.declare_queue(QUEUE_NAME)
         await queue.consume(on_message)
-        dead_letter_queue = await channel.declare_queue(DEAD_LETTER_QUEUE, durable=True, arguments=dead_letter_args)
-        await asyncio.Future()
+        try:
+            await asyncio.Future()
+        finally:
+            depth_reporter.cancel()
+            await smtp_pool.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file